@@ -0,0 +1,186 @@
+# Description: Benchmarks for hosting many XiangqiGame instances in one process. The memory
+#              benchmark reports the bytes taken by each live game, measured with tracemalloc
+#              over a batch of games held at once. The startup benchmark times importing the
+#              module in a fresh interpreter and the moves benchmark times make_move per move
+#              over a full game, including anything it writes to stdout. The fork benchmark
+#              compares forks per second of XiangqiGame.fork against copy.deepcopy, alone and
+#              followed by a move on the copy.
+
+import argparse
+import contextlib
+import copy
+import gc
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from XiangqiGame import XiangqiGame, DEMO_GAME
+
+
+# Moves played on every game of the memory benchmark after its start position, so the
+# measured games carry some move history as live games do
+OPENING = DEMO_GAME[:6]
+
+
+def new_game(moves=()):
+    """ Returns a new XiangqiGame with the moves played. """
+    game = XiangqiGame()
+    for from_str, to_str in moves:
+        game.make_move(from_str, to_str)
+    return game
+
+
+def measure_memory(count, moves=()):
+    """
+    Creates count games, each with the moves played, and keeps them all alive. Returns a
+    dict of the traced bytes per game, the total bytes and the game count.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        games = [new_game(moves) for index in range(count)]
+        gc.collect()
+        total = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del games
+    return {'games': count, 'total_bytes': total, 'bytes_per_game': total / count}
+
+
+def run_memory(args, out=sys.stdout):
+    """ Prints the bytes per game for fresh games and for games with the opening played. """
+    for label, moves in (('start', ()), ('opening', OPENING)):
+        result = measure_memory(args.games, moves)
+        print("memory %-8s games %7d  total %12d bytes  per game %9.0f bytes" % (
+            label, result['games'], result['total_bytes'], result['bytes_per_game']), file=out)
+
+
+def measure_startup(runs):
+    """
+    Returns the mean seconds taken to import XiangqiGame in a fresh interpreter, less the
+    time to start an interpreter that imports nothing, over runs runs. Output is discarded.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    seconds = {}
+    for label, code in (('empty', 'pass'), ('import', 'import XiangqiGame')):
+        start = time.perf_counter()
+        for run in range(runs):
+            subprocess.run([sys.executable, '-c', code], cwd=directory, check=True, stdout=subprocess.DEVNULL)
+        seconds[label] = (time.perf_counter() - start) / runs
+    return seconds['import'] - seconds['empty']
+
+
+def measure_moves(count):
+    """
+    Plays the moves of DEMO_GAME on count new games and returns the mean seconds per
+    make_move call and the bytes written to stdout per move. Output goes to os.devnull, so
+    the time includes formatting it but not displaying it.
+    """
+    counter = CountingWriter()
+    seconds = 0.0
+    with contextlib.redirect_stdout(counter):
+        for run in range(count):
+            game = XiangqiGame()
+            start = time.perf_counter()
+            for from_str, to_str in DEMO_GAME:
+                game.make_move(from_str, to_str)
+            seconds += time.perf_counter() - start
+    moves = count * len(DEMO_GAME)
+    return seconds / moves, counter.get_bytes() / moves
+
+
+class CountingWriter:
+    """ Text stream that writes to os.devnull and counts the characters written. """
+    def __init__(self):
+        """ Initializes data members and opens os.devnull. """
+        self._out = open(os.devnull, 'w')
+        self._bytes = 0
+
+    def write(self, text):
+        """ Writes text and adds its length to the count. """
+        self._bytes += len(text)
+        return self._out.write(text)
+
+    def flush(self):
+        """ Flushes the underlying stream. """
+        self._out.flush()
+
+    def get_bytes(self):
+        """ Returns the number of characters written. """
+        return self._bytes
+
+
+def run_startup(args, out=sys.stdout):
+    """ Prints the time taken to import XiangqiGame. """
+    print("startup  import XiangqiGame %8.1f ms (mean of %d runs)" % (1000 * measure_startup(args.runs), args.runs),
+          file=out)
+
+
+def run_moves(args, out=sys.stdout):
+    """ Prints the time and stdout bytes per make_move call. """
+    seconds, written = measure_moves(args.runs)
+    print("moves    make_move %8.1f us per move, %6.0f stdout bytes per move (%d games of %d moves)" % (
+        1e6 * seconds, written, args.runs, len(DEMO_GAME)), file=out)
+
+
+def measure_fork(count, moves=OPENING):
+    """
+    Copies a game with the moves played count times with each of fork() and deepcopy,
+    first alone and then followed by a move on the copy (the next move of DEMO_GAME), and
+    returns a dict of the copies per second by (copy method, 'copy' or 'move').
+    """
+    game = new_game(moves)
+    from_str, to_str = DEMO_GAME[len(moves)]
+    copiers = (('fork', XiangqiGame.fork), ('deepcopy', copy.deepcopy))
+    rates = {}
+    for label, copier in copiers:
+        for action in ('copy', 'move'):
+            start = time.perf_counter()
+            for run in range(count):
+                branch = copier(game)
+                if action == 'move':
+                    branch.make_move(from_str, to_str)
+            rates[(label, action)] = count / (time.perf_counter() - start)
+    return rates
+
+
+def run_fork(args, out=sys.stdout):
+    """ Prints the forks per second of fork() and deepcopy, without and with a move. """
+    rates = measure_fork(args.games)
+    for action, label in (('copy', 'copy'), ('move', 'copy + move')):
+        print("fork     %-12s fork() %9.0f per sec  deepcopy %9.0f per sec  (%.1fx, %d copies)" % (
+            label, rates[('fork', action)], rates[('deepcopy', action)],
+            rates[('fork', action)] / rates[('deepcopy', action)], args.games), file=out)
+
+
+# Benchmarks by command line name
+BENCHMARKS = {
+    'fork': run_fork,
+    'memory': run_memory,
+    'startup': run_startup,
+    'moves': run_moves,
+}
+
+
+def main(argv=None):
+    """ Command line entry point. """
+    parser = argparse.ArgumentParser(description="Benchmarks for hosting many Xiangqi games.")
+    parser.add_argument("benchmark", nargs="*",
+                        help="benchmarks to run: " + ", ".join(sorted(BENCHMARKS)) + " (default: all)")
+    parser.add_argument("-g", "--games", type=int, default=1000,
+                        help="games to create, or games to copy in the fork benchmark (default 1000)")
+    parser.add_argument("-r", "--runs", type=int, default=20, help="startup and moves benchmark runs (default 20)")
+    args = parser.parse_args(argv)
+    for name in args.benchmark:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark " + name)
+
+    for name in args.benchmark or sorted(BENCHMARKS):
+        BENCHMARKS[name](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# Description: Opening book for XiangqiGame. The opening moves of a corpus of games are
+#              replayed through XiangqiGame and counted per position (by Zobrist key) and
+#              move, with the results of the games they were played in. The counts are
+#              written to a file of fixed-size entries sorted by key, read through mmap and
+#              searched by bisection, so the book replies of a position cost one lookup.
+#
+#              File layout (all integers little-endian):
+#                header      magic 'XQBK', version, the number of plies of each game that
+#                            were counted and the entry count
+#                entries     per position and move, sorted by key then move: the position's
+#                            Zobrist key (uint64), the from and to square indexes (row * 9 +
+#                            column, one byte each), and the number of games (uint32) the move
+#                            was played in, won by red (uint32) and won by black (uint32)
+
+import argparse
+import bisect
+import mmap
+import struct
+import sys
+
+from XiangqiGame import XiangqiGame, START_FEN
+from XiangqiDatabase import GameDatabase, UInt64Table, RESULTS, split_move, game_from_command_line
+
+MAGIC = b'XQBK'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQ')
+ENTRY = struct.Struct('<QBBIII')
+
+# Plies of each game counted by default (the first 15 moves of each player)
+DEFAULT_PLIES = 30
+
+
+class BookWriter:
+    """
+    Counts the opening moves of games added with add_game or add_moves and writes the
+    book file when closed (or at the end of a with statement). Only the first plies
+    moves of each game are counted.
+    """
+    def __init__(self, path, plies=DEFAULT_PLIES, min_games=1):
+        """
+        Initializes data members. Moves played in fewer than min_games games are left
+        out of the book.
+        """
+        self._path = path
+        self._plies = plies
+        self._min_games = min_games
+        # [games, red wins, black wins] by (key, from index, to index)
+        self._counts = {}
+        self._game_count = 0
+        self._closed = False
+
+    def __enter__(self):
+        """ Returns the writer for use in a with statement. """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """ Writes the book at the end of a with statement. """
+        self.close()
+
+    def get_game_count(self):
+        """ Returns the number of games added so far. """
+        return self._game_count
+
+    def add_game(self, game):
+        """
+        Counts the opening moves of a XiangqiGame from its move and key histories, with
+        the game's state as its result. Nothing is replayed.
+        """
+        moves = game.get_move_history()
+        keys = game.get_key_history()
+        result = RESULTS[game.get_game_state()]
+        counts = self._counts
+        for ply in range(min(self._plies, len(moves))):
+            from_loc, to_loc = moves[ply]
+            entry_key = (keys[ply], from_loc[0] * 9 + from_loc[1], to_loc[0] * 9 + to_loc[1])
+            entry = counts.get(entry_key)
+            if entry is None:
+                entry = counts[entry_key] = [0, 0, 0]
+            entry[0] += 1
+            if result:
+                entry[result] += 1
+        self._game_count += 1
+
+    def add_moves(self, moves):
+        """
+        Plays moves given as algebraic (from, to) pairs from the start position with
+        apply_moves (checking each move, with one end-of-game scan) and counts the game.
+        Raises ValueError if a move is illegal.
+        """
+        moves = list(moves)
+        game = XiangqiGame()
+        ply = game.apply_moves(moves, verify="legality")
+        if ply is not None:
+            raise ValueError("illegal move " + moves[ply][0] + moves[ply][1] + " at ply " + str(ply))
+        self.add_game(game)
+
+    def close(self):
+        """ Writes the entries played in at least min_games games, sorted by key and move. """
+        if self._closed:
+            return
+        entries = sorted(entry_key + tuple(entry) for entry_key, entry in self._counts.items()
+                         if entry[0] >= self._min_games)
+        with open(self._path, 'wb') as out:
+            out.write(HEADER.pack(MAGIC, VERSION, self._plies, len(entries)))
+            for entry in entries:
+                out.write(ENTRY.pack(*entry))
+        self._counts = {}
+        self._closed = True
+
+
+class OpeningBook:
+    """
+    Read access to an opening book file through mmap. Call close() (or use as a context
+    manager) when done.
+    """
+    def __init__(self, path):
+        """ Initializes data members, maps the file and reads its header. """
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._plies, self._entry_count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(path + " is not a version " + str(VERSION) + " opening book")
+        self._keys = UInt64Table(self._map, HEADER.size, self._entry_count, ENTRY.size)
+
+    def __enter__(self):
+        """ Returns the book for use in a with statement. """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """ Closes the book at the end of a with statement. """
+        self.close()
+
+    def __len__(self):
+        """ Returns the number of entries (positions and moves). """
+        return self._entry_count
+
+    def close(self):
+        """ Unmaps the file. """
+        self._map.close()
+
+    def get_plies(self):
+        """ Returns the number of plies of each game that were counted. """
+        return self._plies
+
+    def lookup(self, key):
+        """
+        Returns a list of (from_loc, to_loc, games, red_wins, black_wins) tuples of the
+        moves played in the position with the Zobrist key, most played first.
+        """
+        keys = self._keys
+        index = bisect.bisect_left(keys, key)
+        found = []
+        while index < len(keys) and keys[index] == key:
+            entry_key, from_index, to_index, games, red_wins, black_wins = ENTRY.unpack_from(
+                self._map, HEADER.size + ENTRY.size * index)
+            found.append((divmod(from_index, 9), divmod(to_index, 9), games, red_wins, black_wins))
+            index += 1
+        found.sort(key=lambda entry: entry[2], reverse=True)
+        return found
+
+
+def main(argv=None):
+    """ Command line entry point. Returns the process exit status. """
+    parser = argparse.ArgumentParser(description="Build and query Xiangqi opening books.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build a book from a game database (.xqdb) or a text file of games")
+    build.add_argument("book")
+    build.add_argument("games", help="game database, or text file of games, moves such as c1e3 separated by spaces")
+    build.add_argument("-p", "--plies", type=int, default=DEFAULT_PLIES,
+                       help="plies of each game to count (default %d)" % DEFAULT_PLIES)
+    build.add_argument("-m", "--min-games", type=int, default=1, help="leave out moves played in fewer games")
+    moves = commands.add_parser("moves", help="list the book moves of a position")
+    moves.add_argument("book")
+    moves.add_argument("moves", nargs="*", help="moves to play from the --fen position, e.g. c1e3 e7e6")
+    moves.add_argument("--fen", default=START_FEN, help="position to start from, in Xiangqi FEN")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        with BookWriter(args.book, args.plies, args.min_games) as writer:
+            if args.games.endswith('.xqdb'):
+                with GameDatabase(args.games) as database:
+                    for index in range(len(database)):
+                        writer.add_game(database.get_game(index))
+            else:
+                with open(args.games) as games:
+                    for line_number, line in enumerate(games, 1):
+                        if not line.strip():
+                            continue
+                        try:
+                            writer.add_moves([split_move(move) for move in line.split()])
+                        except ValueError as error:
+                            print("line %d: %s" % (line_number, error), file=sys.stderr)
+            print("%d games counted" % writer.get_game_count())
+        return 0
+
+    with OpeningBook(args.book) as book:
+        game = game_from_command_line(parser, args.fen, args.moves)
+        for from_str, to_str, games, score in game.book_moves(book):
+            print("%s%s  games %6d  score %5.1f%%" % (from_str, to_str, games, 100 * score))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,402 @@
+# Description: Binary game database for XiangqiGame. Games played from the start position
+#              are stored back to back in one file, each move packed into 2 bytes (the from
+#              and to square indexes, row * 9 + column), with an offset index of the games
+#              and a position index sorted by Zobrist key, so the games reaching a position
+#              can be found by binary search without replaying the database. Files are read
+#              through mmap.
+#
+#              File layout (all integers little-endian):
+#                header      magic 'XQDB', version, game count, position count and the file
+#                            offsets of the four tables below
+#                games       per game: a result byte (see RESULTS), then 2 bytes per move
+#                offsets     game count + 1 uint64 file offsets; game i spans offsets i to i + 1
+#                keys        position count uint64 Zobrist keys, sorted
+#                game ids    position count uint32 game indexes, in the order of the keys
+#                plies       position count uint16 plies (0 is the start position)
+
+import argparse
+import bisect
+import heapq
+import itertools
+import mmap
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+
+from XiangqiGame import XiangqiGame, START_FEN, ALGEBRAIC_LOCS
+
+MAGIC = b'XQDB'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIIQQQQ')
+
+# Result byte of a game record, by game state
+RESULTS = {"UNFINISHED": 0, "RED_WON": 1, "BLACK_WON": 2}
+GAME_STATES = {code: state for state, code in RESULTS.items()}
+
+# Positions a DatabaseWriter holds in memory before writing them, sorted, to a temporary
+# run file; close merges the runs. Positions are written in batches of BATCH_POSITIONS.
+RUN_POSITIONS = 1 << 20
+BATCH_POSITIONS = 4096
+# (key, game, ply) record of a sorted run file
+RUN_RECORD = struct.Struct('<QIH')
+
+
+def encode_move(from_loc, to_loc):
+    """ Returns a move between (row, column) tuples packed as 2 bytes of square indexes. """
+    return bytes((from_loc[0] * 9 + from_loc[1], to_loc[0] * 9 + to_loc[1]))
+
+
+def decode_moves(data):
+    """ Returns the list of (from_loc, to_loc) tuples of moves packed by encode_move. """
+    return [(divmod(data[index], 9), divmod(data[index + 1], 9)) for index in range(0, len(data), 2)]
+
+
+def write_array(out, typecode, values):
+    """ Writes values to file out as a little-endian array of the array module's typecode. """
+    values = array(typecode, values)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    out.write(values.tobytes())
+
+
+def pad_to(out, alignment):
+    """ Writes zero bytes to file out until its position is a multiple of alignment. """
+    position = out.tell()
+    if position % alignment:
+        out.write(bytes(alignment - position % alignment))
+
+
+class DatabaseWriter:
+    """
+    Writes a game database file. Games are added one at a time with add_game or
+    add_moves and written to the file straight away; the offset and position indexes are
+    written by close (or at the end of a with statement). Positions are kept in typed
+    arrays, and every RUN_POSITIONS of them are sorted and moved to a temporary run file,
+    so memory use does not grow with the number of games.
+    """
+    def __init__(self, path):
+        """ Initializes data members and opens the file, leaving room for the header. """
+        self._out = open(path, 'wb')
+        self._out.write(bytes(HEADER.size))
+        self._offsets = array('Q')
+        # key, game and ply of each position not yet in a run, in the order added
+        self._keys = array('Q')
+        self._games = array('I')
+        self._plies = array('H')
+        # temporary files of sorted runs of positions, see write_run
+        self._runs = []
+        self._position_count = 0
+        self._start_key = XiangqiGame().position_key()
+
+    def __enter__(self):
+        """ Returns the writer for use in a with statement. """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """ Closes the writer at the end of a with statement. """
+        self.close()
+
+    def get_game_count(self):
+        """ Returns the number of games added so far. """
+        return len(self._offsets)
+
+    def add_game(self, game):
+        """
+        Adds the moves and game state of a XiangqiGame played from the start position.
+        The position keys are taken from the game's key history, so nothing is replayed.
+        Returns the index of the game in the database. Raises ValueError if the game did
+        not start from the start position.
+        """
+        moves = game.get_move_history()
+        keys = game.get_key_history()
+        if keys[0] != self._start_key or len(keys) != len(moves) + 1:
+            raise ValueError("only games played from the start position can be stored")
+        index = len(self._offsets)
+        self._offsets.append(self._out.tell())
+        record = bytearray((RESULTS[game.get_game_state()],))
+        for move in moves:
+            record += encode_move(move[0], move[1])
+        self._out.write(record)
+        self._keys.extend(keys)
+        self._games.extend(array('I', (index,)) * len(keys))
+        self._plies.extend(range(len(keys)))
+        self._position_count += len(keys)
+        if len(self._keys) >= RUN_POSITIONS:
+            self.write_run()
+        return index
+
+    def add_moves(self, moves):
+        """
+        Plays moves given as algebraic (from, to) pairs, such as ('c1', 'e3'), from the
+        start position with apply_moves (checking each move, with one end-of-game scan)
+        and adds the game. Returns the index of the game in the database. Raises
+        ValueError if a move is illegal.
+        """
+        moves = list(moves)
+        game = XiangqiGame()
+        ply = game.apply_moves(moves, verify="legality")
+        if ply is not None:
+            raise ValueError("illegal move " + moves[ply][0] + moves[ply][1] + " at ply " + str(ply))
+        return self.add_game(game)
+
+    def sorted_positions(self):
+        """
+        Returns an iterator of the (key, game, ply) positions held in memory, sorted. They
+        were added in game and ply order, so a stable sort on the key alone is enough.
+        """
+        keys, games, plies = self._keys, self._games, self._plies
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        return ((keys[index], games[index], plies[index]) for index in order)
+
+    def write_run(self):
+        """ Sorts the positions held in memory into a new temporary run file and clears them. """
+        run = tempfile.TemporaryFile()
+        positions = self.sorted_positions()
+        while True:
+            batch = list(itertools.islice(positions, BATCH_POSITIONS))
+            if not batch:
+                break
+            run.write(b''.join(RUN_RECORD.pack(*position) for position in batch))
+        self._runs.append(run)
+        self._keys = array('Q')
+        self._games = array('I')
+        self._plies = array('H')
+
+    def read_run(self, run):
+        """ Yields the (key, game, ply) positions of a run file, in order. """
+        run.seek(0)
+        while True:
+            data = run.read(RUN_RECORD.size * BATCH_POSITIONS)
+            if not data:
+                break
+            yield from RUN_RECORD.iter_unpack(data)
+
+    def close(self):
+        """ Writes the offset and position indexes and the header, then closes the file. """
+        out = self._out
+        if out.closed:
+            return
+        game_count = len(self._offsets)
+        self._offsets.append(out.tell())
+        if self._runs:
+            if self._keys:
+                self.write_run()
+            positions = heapq.merge(*(self.read_run(run) for run in self._runs))
+        else:
+            positions = self.sorted_positions()
+
+        pad_to(out, 8)
+        offsets_offset = out.tell()
+        write_array(out, 'Q', self._offsets)
+        # the key column is written straight to the file and the game and ply columns,
+        # which follow it, to temporary files copied in after it
+        keys_offset = out.tell()
+        with tempfile.TemporaryFile() as games, tempfile.TemporaryFile() as plies:
+            while True:
+                batch = list(itertools.islice(positions, BATCH_POSITIONS))
+                if not batch:
+                    break
+                write_array(out, 'Q', (position[0] for position in batch))
+                write_array(games, 'I', (position[1] for position in batch))
+                write_array(plies, 'H', (position[2] for position in batch))
+            games_offset = out.tell()
+            games.seek(0)
+            shutil.copyfileobj(games, out)
+            plies_offset = out.tell()
+            plies.seek(0)
+            shutil.copyfileobj(plies, out)
+
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, VERSION, 0, game_count, self._position_count, offsets_offset, keys_offset,
+                              games_offset, plies_offset))
+        out.close()
+        for run in self._runs:
+            run.close()
+        self._runs = []
+        self._keys = array('Q')
+        self._games = array('I')
+        self._plies = array('H')
+
+
+class UInt64Table:
+    """
+    Read-only sequence of little-endian uint64 values in a buffer, for bisection. Values
+    are stride bytes apart (the first field of fixed-size records, for instance).
+    """
+    def __init__(self, buffer, offset, count, stride=8):
+        """ Initializes data members. """
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+        self._stride = stride
+
+    def __len__(self):
+        """ Returns the number of values. """
+        return self._count
+
+    def __getitem__(self, index):
+        """ Returns the value at index. """
+        return struct.unpack_from('<Q', self._buffer, self._offset + self._stride * index)[0]
+
+
+class GameDatabase:
+    """
+    Read access to a game database file through mmap. Games are numbered from 0 in the
+    order they were added. Call close() (or use as a context manager) when done.
+    """
+    def __init__(self, path):
+        """ Initializes data members, maps the file and reads its header. """
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, reserved, self._game_count, self._position_count, self._offsets_offset,
+         keys_offset, self._games_offset, self._plies_offset) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(path + " is not a version " + str(VERSION) + " game database")
+        self._keys = UInt64Table(self._map, keys_offset, self._position_count)
+
+    def __enter__(self):
+        """ Returns the database for use in a with statement. """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """ Closes the database at the end of a with statement. """
+        self.close()
+
+    def __len__(self):
+        """ Returns the number of games. """
+        return self._game_count
+
+    def close(self):
+        """ Unmaps the file. """
+        self._map.close()
+
+    def get_position_count(self):
+        """ Returns the number of positions in the position index. """
+        return self._position_count
+
+    def game_span(self, index):
+        """ Returns the file offsets (start, end) of a game's record. """
+        if not 0 <= index < self._game_count:
+            raise IndexError("game index out of range")
+        return struct.unpack_from('<2Q', self._map, self._offsets_offset + 8 * index)
+
+    def get_result(self, index):
+        """ Returns the game state ('UNFINISHED', 'RED_WON' or 'BLACK_WON') a game ended in. """
+        return GAME_STATES[self._map[self.game_span(index)[0]]]
+
+    def get_ply_count(self, index):
+        """ Returns the number of moves (plies) of a game. """
+        start, end = self.game_span(index)
+        return (end - start - 1) // 2
+
+    def get_moves(self, index):
+        """ Returns the list of (from_loc, to_loc) tuples of a game's moves. """
+        start, end = self.game_span(index)
+        return decode_moves(self._map[start + 1:end])
+
+    def get_game(self, index, ply=None):
+        """
+        Returns a new XiangqiGame with the first ply moves of a game made (all of them if
+        ply is None). The stored moves are trusted and made with push_move, then the game
+        state is computed once.
+        """
+        game = XiangqiGame()
+        for from_loc, to_loc in self.get_moves(index)[:ply]:
+            game.push_move(from_loc, to_loc)
+        game.update_game_state()
+        return game
+
+    def find_position(self, key):
+        """
+        Returns a list of (game, ply) pairs of every time the position with the Zobrist key
+        occurred in the database, in game order.
+        """
+        keys = self._keys
+        low = bisect.bisect_left(keys, key)
+        found = []
+        while low < len(keys) and keys[low] == key:
+            game = struct.unpack_from('<I', self._map, self._games_offset + 4 * low)[0]
+            ply = struct.unpack_from('<H', self._map, self._plies_offset + 2 * low)[0]
+            found.append((game, ply))
+            low += 1
+        return found
+
+    def games_reaching(self, game):
+        """ Returns the sorted indexes of the games that reached the XiangqiGame's current position. """
+        return sorted({index for index, ply in self.find_position(game.position_key())})
+
+
+def split_move(move):
+    """
+    Splits a move such as 'h10g8' into its from and to squares ('h10', 'g8'). Raises
+    ValueError if the move is not two board squares.
+    """
+    split = 2 if len(move) > 2 and move[2].isalpha() else 3
+    from_str, to_str = move[:split], move[split:]
+    if from_str not in ALGEBRAIC_LOCS or to_str not in ALGEBRAIC_LOCS:
+        raise ValueError("malformed move " + move)
+    return from_str, to_str
+
+
+def game_from_command_line(parser, fen, moves):
+    """
+    Returns a game set up from a position in Xiangqi FEN with moves such as 'c1e3' played,
+    for a command line tool: a malformed FEN, a malformed move or an illegal move is
+    reported with parser.error (an argparse.ArgumentParser), which exits.
+    """
+    try:
+        game = XiangqiGame.from_fen(fen)
+    except ValueError as error:
+        parser.error(str(error))
+    for move in moves:
+        try:
+            from_str, to_str = split_move(move)
+        except ValueError as error:
+            parser.error(str(error))
+        if game.make_move(from_str, to_str) is False:
+            parser.error("illegal move " + move)
+    return game
+
+
+def main(argv=None):
+    """ Command line entry point. Returns the process exit status. """
+    parser = argparse.ArgumentParser(description="Build and query Xiangqi game databases.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build a database from a text file of games, one per line")
+    build.add_argument("database")
+    build.add_argument("games", help="text file of games, moves such as c1e3 separated by spaces")
+    info = commands.add_parser("info", help="print the number of games and positions")
+    info.add_argument("database")
+    find = commands.add_parser("find", help="list the games that reached a position")
+    find.add_argument("database")
+    find.add_argument("moves", nargs="*", help="moves to play from the --fen position, e.g. c1e3 e7e6")
+    find.add_argument("--fen", default=START_FEN, help="position to start from, in Xiangqi FEN")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        with open(args.games) as games, DatabaseWriter(args.database) as writer:
+            for line_number, line in enumerate(games, 1):
+                if not line.strip():
+                    continue
+                try:
+                    writer.add_moves([split_move(move) for move in line.split()])
+                except ValueError as error:
+                    print("line %d: %s" % (line_number, error), file=sys.stderr)
+            print("%d games written" % writer.get_game_count())
+        return 0
+
+    with GameDatabase(args.database) as database:
+        if args.command == "info":
+            print("%d games, %d positions" % (len(database), database.get_position_count()))
+            return 0
+        game = game_from_command_line(parser, args.fen, args.moves)
+        for index, ply in database.find_position(game.position_key()):
+            print("game %d ply %d (%s)" % (index, ply, database.get_result(index)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,417 @@
+# Description: Move search for XiangqiGame. Picks a move for the player to move with a negamax
+#              alpha-beta search using iterative deepening, move ordering (captures first,
+#              killer moves and history heuristic), quiescence search on captures, and a
+#              time or node budget.
+
+import argparse
+import time
+
+from XiangqiGame import START_FEN, square_to_loc, TYPE_MASK, EMPTY, PIECE_VALUES
+from XiangqiTransposition import TranspositionTable, EXACT, LOWER, UPPER
+from XiangqiTablebase import Tablebase
+from XiangqiBook import OpeningBook
+from XiangqiDatabase import game_from_command_line
+
+# Score of being checkmated at the root; mates found deeper score closer to zero so that
+# shorter mates are preferred
+MATE = 100000
+INFINITY = MATE + 1
+MAX_PLY = 64
+# Scores beyond this are mate scores
+MATE_BOUND = MATE - 2 * MAX_PLY
+
+# Move ordering scores
+PV_MOVE_ORDER = 1 << 30
+CAPTURE_ORDER = 1 << 20
+KILLER_ORDER = 1 << 19
+
+# How often (in nodes) the time budget is checked
+CHECK_INTERVAL = 1024
+
+
+def score_to_tt(score, ply):
+    """
+    Converts a score to store in the transposition table: mate scores are made relative to
+    the stored position instead of the root.
+    """
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    """ Converts a score read from the transposition table back to be relative to the root. """
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+class SearchTimeout(Exception):
+    """ Raised inside the search when the time or node budget runs out. """
+    pass
+
+
+class SearchResult:
+    """ Result of a search: best move, principal variation, score and search statistics. """
+    def __init__(self, best_move, pv, score, depth, nodes, seconds):
+        """ Initializes data members. """
+        self._best_move = best_move
+        self._pv = pv
+        self._score = score
+        self._depth = depth
+        self._nodes = nodes
+        self._seconds = seconds
+
+    def __repr__(self):
+        """ Display best move, score and statistics when printing results. """
+        return "SearchResult(best_move=%r, score=%d, depth=%d, nodes=%d, nps=%.0f, pv=%s)" % (
+            self._best_move, self._score, self._depth, self._nodes, self.get_nps(), " ".join(
+                from_alg + to_alg for from_alg, to_alg in self._pv))
+
+    def get_best_move(self):
+        """ Returns the best move as a pair of algebraic squares, or None if there are no legal moves. """
+        return self._best_move
+
+    def get_pv(self):
+        """ Returns the principal variation as a list of pairs of algebraic squares. """
+        return self._pv
+
+    def get_score(self):
+        """ Returns the score in material points (soldier = 10) from the point of view of the player to move. """
+        return self._score
+
+    def get_depth(self):
+        """ Returns the depth of the last completed iteration. """
+        return self._depth
+
+    def get_nodes(self):
+        """ Returns the number of nodes searched. """
+        return self._nodes
+
+    def get_seconds(self):
+        """ Returns the search time in seconds. """
+        return self._seconds
+
+    def get_nps(self):
+        """ Returns the search speed in nodes per second. """
+        return self._nodes / self._seconds if self._seconds > 0 else 0.0
+
+
+class XiangqiEngine:
+    """
+    Alpha-beta search engine on top of a XiangqiGame. Searches the game's current position
+    by making and unmaking moves on the game itself, which is left as it was found.
+    Search results are kept in a transposition table (a new one of hash_mb megabytes
+    unless one is passed in), which persists between searches. If stop is given, it is
+    called as the search runs and the search stops as if out of time once it returns True.
+    If tablebase (a XiangqiTablebase.Tablebase) is given, positions below the root that
+    it has a table for are scored from the table instead of being searched. If book (a
+    XiangqiBook.OpeningBook) is given, positions it has moves for are not searched: the
+    most played book move is returned.
+    """
+    def __init__(self, game, tt=None, hash_mb=16, stop=None, tablebase=None, book=None):
+        """ Initializes data members. """
+        self._game = game
+        self._tt = tt if tt is not None else TranspositionTable(hash_mb)
+        self._stop = stop
+        self._tablebase = tablebase
+        self._book = book
+        self._nodes = 0
+        self._deadline = None
+        self._max_nodes = None
+        # two killer moves (quiet moves that caused a beta cutoff) per ply
+        self._killers = [[None, None] for ply in range(MAX_PLY + 1)]
+        # history heuristic: how often each quiet move caused a cutoff, weighted by depth
+        self._history = {}
+        # principal variation found below each ply
+        self._pv = [[] for ply in range(MAX_PLY + 2)]
+
+    def best_move(self, time_ms=None, max_nodes=None, max_depth=MAX_PLY, start_depth=1, new_search=True):
+        """
+        Searches the current position with iterative deepening, from start_depth until the
+        time budget (milliseconds), the node budget or the maximum depth is reached, and
+        returns a SearchResult for the last completed iteration. The first iteration is
+        always completed. new_search=False keeps the transposition table's generation
+        (used when several engines share one table). A book move is returned as a result
+        of depth 0.
+        """
+        start = time.perf_counter()
+        if self._book is not None:
+            book_moves = self._game.book_moves(self._book)
+            if book_moves:
+                move = book_moves[0][:2]
+                return SearchResult(move, [move], 0, 0, 0, time.perf_counter() - start)
+
+        self._nodes = 0
+        self._killers = [[None, None] for ply in range(MAX_PLY + 1)]
+        self._history = {}
+        if new_search:
+            self._tt.new_search()
+        self._max_nodes = None
+        self._deadline = None
+
+        result = SearchResult(None, [], 0, 0, 0, 0.0)
+        pv = []
+        for depth in range(start_depth, max_depth + 1):
+            try:
+                score = self.search(depth, -INFINITY, INFINITY, 0, pv[0] if pv else None)
+            except SearchTimeout:
+                break
+            pv = self._pv[0]
+            result = SearchResult(self.move_to_str(pv[0]) if pv else None,
+                                  [self.move_to_str(move) for move in pv], score, depth, self._nodes,
+                                  time.perf_counter() - start)
+            # budgets only apply once the first iteration has produced a move
+            if time_ms is not None:
+                self._deadline = start + time_ms / 1000
+                # do not start an iteration that cannot finish in the time left
+                if time.perf_counter() - start > time_ms / 2000:
+                    break
+            self._max_nodes = max_nodes
+            if max_nodes is not None and self._nodes >= max_nodes:
+                break
+            # stop once a forced mate has been found
+            if not pv or abs(score) >= MATE_BOUND:
+                break
+
+        # report the nodes and time spent in an unfinished iteration as well
+        return SearchResult(result.get_best_move(), result.get_pv(), result.get_score(), result.get_depth(),
+                            self._nodes, time.perf_counter() - start)
+
+    def get_tt(self):
+        """ Returns the engine's transposition table. """
+        return self._tt
+
+    def move_to_str(self, move):
+        """ Converts a move of mailbox squares to a pair of algebraic squares. """
+        return (self._game.tuple_to_str(square_to_loc(move[0])),
+                self._game.tuple_to_str(square_to_loc(move[1])))
+
+    def check_limits(self):
+        """ Raises SearchTimeout if the time or node budget has run out or the search was stopped. """
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise SearchTimeout()
+        if self._stop is not None and self._stop():
+            raise SearchTimeout()
+        if self._max_nodes is not None and self._nodes >= self._max_nodes:
+            raise SearchTimeout()
+
+    def evaluate(self):
+        """
+        Returns the static evaluation of the current position (material and piece-square
+        values, kept up to date by the game as moves are made and unmade) from the point
+        of view of the player to move.
+        """
+        return self._game.evaluate()
+
+    def generate_moves(self, captures_only=False):
+        """
+        Returns a list of (from_square, to_square, order) tuples of the pseudo-legal moves
+        of the player to move (moves that may leave their general in check), with a move
+        ordering score for captures: most valuable victim first, least valuable attacker
+        first among equal victims.
+        """
+        game = self._game
+        moves = []
+        for piece in game.get_pieces(game.get_player_turn()):
+            from_square = piece.get_square()
+            attacker = PIECE_VALUES[piece.get_code() & TYPE_MASK]
+            for to_square in game.get_piece_moves(piece):
+                victim = game.get_code(to_square)
+                if victim != EMPTY:
+                    moves.append((from_square, to_square,
+                                  CAPTURE_ORDER + PIECE_VALUES[victim & TYPE_MASK] * 16 - attacker // 10))
+                elif not captures_only:
+                    moves.append((from_square, to_square, 0))
+        return moves
+
+    def order_moves(self, moves, ply, pv_move):
+        """
+        Sorts moves best first: the principal variation move, captures, killer moves, then
+        quiet moves by history score.
+        """
+        killers = self._killers[ply]
+        history = self._history
+        ordered = []
+        for from_square, to_square, order in moves:
+            move = (from_square, to_square)
+            if move == pv_move:
+                order = PV_MOVE_ORDER
+            elif order == 0:
+                if move == killers[0] or move == killers[1]:
+                    order = KILLER_ORDER
+                else:
+                    order = history.get(move, 0)
+            ordered.append((order, move))
+        ordered.sort(key=lambda entry: entry[0], reverse=True)
+        return [move for order, move in ordered]
+
+    def make(self, move):
+        """ Makes move (a pair of mailbox squares) on the game. """
+        self._game.push_move(square_to_loc(move[0]), square_to_loc(move[1]))
+
+    def search(self, depth, alpha, beta, ply, pv_move=None):
+        """
+        Negamax alpha-beta search of the current position to depth plies. Returns the
+        score from the point of view of the player to move and stores the principal
+        variation in self._pv[ply].
+        """
+        self._nodes += 1
+        if self._nodes % CHECK_INTERVAL == 0:
+            self.check_limits()
+        self._pv[ply] = []
+        game = self._game
+
+        # a repeated position is scored as a draw
+        if ply > 0 and game.repetition_count() > 1:
+            return 0
+
+        # an endgame table gives the exact result, mates scored like those found by search
+        if ply > 0 and self._tablebase is not None:
+            result = self._tablebase.probe(game)
+            if result is not None:
+                outcome, plies = result
+                if outcome == 'WIN':
+                    return MATE - ply - plies
+                if outcome == 'LOSS':
+                    return -MATE + ply + plies
+                return 0
+
+        player = game.get_player_turn()
+        in_check = game.is_general_attacked(player)
+        # search one ply deeper when in check so a check is never the last move searched
+        if in_check and ply < MAX_PLY // 2:
+            depth += 1
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.quiesce(alpha, beta, ply)
+
+        # use a stored result for this position if it was searched at least as deep
+        key = game.position_key()
+        entry = self._tt.probe(key)
+        if entry is not None:
+            entry_depth, entry_score, bound, from_square, to_square = entry
+            if pv_move is None and from_square != 0:
+                pv_move = (from_square, to_square)
+            if ply > 0 and entry_depth >= depth:
+                entry_score = score_from_tt(entry_score, ply)
+                if bound == EXACT or (bound == LOWER and entry_score >= beta) \
+                        or (bound == UPPER and entry_score <= alpha):
+                    return entry_score
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = None
+        legal_moves = 0
+        for move in self.order_moves(self.generate_moves(), ply, pv_move):
+            self.make(move)
+            # skip moves that leave the player's own general in check
+            if game.is_general_attacked(player):
+                game.pop_move()
+                continue
+            legal_moves += 1
+            try:
+                score = -self.search(depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                game.pop_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    self._pv[ply] = [move] + self._pv[ply + 1]
+                    if alpha >= beta:
+                        if game.get_code(move[1]) == EMPTY:
+                            self.record_cutoff(move, depth, ply)
+                        break
+
+        # checkmate or stalemate: the player to move has lost
+        if legal_moves == 0:
+            best_score = -MATE + ply
+
+        if best_score >= beta:
+            bound = LOWER
+        elif best_score <= original_alpha:
+            bound = UPPER
+        else:
+            bound = EXACT
+        if best_move is None:
+            self._tt.store(key, depth, score_to_tt(best_score, ply), bound)
+        else:
+            self._tt.store(key, depth, score_to_tt(best_score, ply), bound, best_move[0], best_move[1])
+        return best_score
+
+    def quiesce(self, alpha, beta, ply):
+        """
+        Searches captures only until the position is quiet, so that the static evaluation
+        is never taken in the middle of an exchange. Returns the score from the point of
+        view of the player to move.
+        """
+        self._nodes += 1
+        if self._nodes % CHECK_INTERVAL == 0:
+            self.check_limits()
+        self._pv[ply] = []
+
+        # the player may stand pat instead of capturing
+        stand_pat = self.evaluate()
+        if stand_pat >= beta or ply >= MAX_PLY:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        game = self._game
+        player = game.get_player_turn()
+        for move in self.order_moves(self.generate_moves(captures_only=True), ply, None):
+            self.make(move)
+            if game.is_general_attacked(player):
+                game.pop_move()
+                continue
+            try:
+                score = -self.quiesce(-beta, -alpha, ply + 1)
+            finally:
+                game.pop_move()
+            if score > alpha:
+                alpha = score
+                self._pv[ply] = [move] + self._pv[ply + 1]
+                if alpha >= beta:
+                    break
+        return alpha
+
+    def record_cutoff(self, move, depth, ply):
+        """ Updates the killer moves and history score for a quiet move that caused a cutoff. """
+        killers = self._killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self._history[move] = self._history.get(move, 0) + depth * depth
+
+
+def main(argv=None):
+    """ Command line entry point: searches the position after the given moves and prints the result. """
+    parser = argparse.ArgumentParser(description="Search a Xiangqi position.")
+    parser.add_argument("moves", nargs="*", help="moves to play from the --fen position, e.g. c1e3 e7e6")
+    parser.add_argument("--fen", default=START_FEN, help="position to start from, in Xiangqi FEN")
+    parser.add_argument("-t", "--time", type=int, default=1000, help="time budget in milliseconds")
+    parser.add_argument("-n", "--nodes", type=int, help="node budget")
+    parser.add_argument("-d", "--depth", type=int, default=MAX_PLY, help="maximum depth")
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size in megabytes")
+    parser.add_argument("--tablebase", help="directory of endgame table files")
+    parser.add_argument("--book", help="opening book file")
+    args = parser.parse_args(argv)
+
+    game = game_from_command_line(parser, args.fen, args.moves)
+    tablebase = Tablebase(args.tablebase) if args.tablebase else None
+    book = OpeningBook(args.book) if args.book else None
+    engine = XiangqiEngine(game, hash_mb=args.hash, tablebase=tablebase, book=book)
+    print(engine.best_move(args.time, args.nodes, args.depth))
+    stats = engine.get_tt().get_stats()
+    print("tt: hit %.1f%%  miss %.1f%%  collision %.1f%%  fill %.1f%%" % (
+        100 * stats['hit_rate'], 100 * stats['miss_rate'], 100 * stats['collision_rate'], 100 * stats['fill']))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,401 @@
 # Description: This program is running an abstract Chinese board game called Xiangqi. It is implementing how the
 #              board, rules, and pieces of the game work.
 
+import copy
+import random
+
+# The board is stored as a flat, padded "mailbox" of small integers. The 10 rows x 9
+# columns of the board sit inside a 14 x 11 grid: two sentinel rows above and below
+# the board and one sentinel column on each side (which, once the rows are laid out
+# back to back, also gives two sentinel cells between the right edge of one row and
+# the left edge of the next). Any horse, elephant or sliding move that steps off the
+# board lands on an OFFBOARD cell instead of wrapping around.
+BOARD_WIDTH = 11
+BOARD_SIZE = 14 * BOARD_WIDTH
+
+# Square contents: piece type in the low 3 bits, player in the next 2 bits
+EMPTY = 0
+GENERAL = 1
+ADVISOR = 2
+ELEPHANT = 3
+HORSE = 4
+CHARIOT = 5
+CANNON = 6
+SOLDIER = 7
+TYPE_MASK = 7
+RED = 8
+BLACK = 16
+OFFBOARD = 32
+
+# Mailbox offsets for one step in each direction
+UP = BOARD_WIDTH
+DOWN = -BOARD_WIDTH
+LEFT = -1
+RIGHT = 1
+
+
+def loc_to_square(loc):
+    """ Converts a (row, column) tuple to its mailbox square index. """
+    return (loc[0] + 2) * BOARD_WIDTH + loc[1] + 1
+
+
+def square_to_loc(square):
+    """ Converts a mailbox square index to its (row, column) tuple. """
+    return square // BOARD_WIDTH - 2, square % BOARD_WIDTH - 1
+
+
+def empty_mailbox():
+    """ Returns a mailbox with every board square EMPTY and every padding cell OFFBOARD. """
+    squares = bytearray([OFFBOARD]) * BOARD_SIZE
+    for row in range(10):
+        for col in range(9):
+            squares[loc_to_square((row, col))] = EMPTY
+    return squares
+
+
+def on_board(square):
+    """ Returns True if mailbox square index is one of the 90 board squares. """
+    row, col = square_to_loc(square)
+    return 0 <= row <= 9 and 0 <= col <= 8
+
+
+# Squares of the board, and the squares each player's General, Advisors and Elephants are
+# confined to. These are shared by every piece (see Piece._BOUNDARIES) and never modified.
+BOARD_SQUARES = frozenset(loc_to_square((row, col)) for row in range(0, 10) for col in range(0, 9))
+PALACE = {
+    RED: frozenset(loc_to_square((row, col)) for row in range(0, 3) for col in range(3, 6)),
+    BLACK: frozenset(loc_to_square((row, col)) for row in range(7, 10) for col in range(3, 6)),
+}
+ADVISOR_SQUARES = {
+    RED: frozenset(loc_to_square(loc) for loc in [(0, 3), (0, 5), (1, 4), (2, 3), (2, 5)]),
+    BLACK: frozenset(loc_to_square(loc) for loc in [(7, 3), (7, 5), (8, 4), (9, 3), (9, 5)]),
+}
+ELEPHANT_SQUARES = {
+    RED: frozenset(loc_to_square(loc) for loc in [(0, 2), (0, 6), (2, 0), (2, 4), (2, 8), (4, 2), (4, 6)]),
+    BLACK: frozenset(loc_to_square(loc) for loc in [(5, 2), (5, 6), (7, 0), (7, 4), (7, 8), (9, 2), (9, 6)]),
+}
+
+ORTHOGONALS = (LEFT, RIGHT, DOWN, UP)
+DIAGONALS = (UP + RIGHT, UP + LEFT, DOWN + RIGHT, DOWN + LEFT)
+
+
+def build_step_table(steps, boundaries):
+    """
+    Returns a list indexed by mailbox square holding a tuple of the squares one step
+    away (for each step offset) that lie within boundaries.
+    """
+    table = [()] * BOARD_SIZE
+    for square in boundaries:
+        table[square] = tuple(square + step for step in steps if square + step in boundaries)
+    return table
+
+
+def build_elephant_table(boundaries):
+    """
+    Returns a list indexed by mailbox square holding a tuple of (destination, eye) pairs,
+    where eye is the square the elephant jumps over and must be empty.
+    """
+    table = [()] * BOARD_SIZE
+    for square in boundaries:
+        table[square] = tuple((square + 2 * step, square + step) for step in DIAGONALS
+                              if square + 2 * step in boundaries)
+    return table
+
+
+def build_horse_table():
+    """
+    Returns a list indexed by mailbox square holding a tuple of (destination, leg) pairs,
+    where leg is the orthogonally adjacent square that must be empty for the horse to move.
+    """
+    table = [()] * BOARD_SIZE
+    for square in range(BOARD_SIZE):
+        if not on_board(square):
+            continue
+        moves = []
+        for leg_step in ORTHOGONALS:
+            side_step = UP if leg_step in (LEFT, RIGHT) else RIGHT
+            for move in (square + 2 * leg_step + side_step, square + 2 * leg_step - side_step):
+                if on_board(move):
+                    moves.append((move, square + leg_step))
+        table[square] = tuple(moves)
+    return table
+
+
+def build_soldier_table(side):
+    """
+    Returns a list indexed by mailbox square holding a tuple of the squares a soldier of
+    side can step to: forward only on its own side of the river, forward or sideways once
+    it has crossed.
+    """
+    forward = UP if side == RED else DOWN
+    table = [()] * BOARD_SIZE
+    for square in range(BOARD_SIZE):
+        if not on_board(square):
+            continue
+        row = square_to_loc(square)[0]
+        crossed = row >= 5 if side == RED else row <= 4
+        steps = (LEFT, RIGHT, forward) if crossed else (forward,)
+        table[square] = tuple(square + step for step in steps if on_board(square + step))
+    return table
+
+
+# Move tables, computed once at import time
+GENERAL_MOVES = {side: build_step_table(ORTHOGONALS, PALACE[side]) for side in (RED, BLACK)}
+ADVISOR_MOVES = {side: build_step_table(DIAGONALS, ADVISOR_SQUARES[side]) for side in (RED, BLACK)}
+ELEPHANT_MOVES = {side: build_elephant_table(ELEPHANT_SQUARES[side]) for side in (RED, BLACK)}
+HORSE_MOVES = build_horse_table()
+SOLDIER_MOVES = {side: build_soldier_table(side) for side in (RED, BLACK)}
+
+
+def build_slide_table(length, stride):
+    """
+    Builds the sliding-piece lookup for one kind of line (a rank of 9 squares or a file of
+    10 squares). Returns a list indexed by the slider's position on the line, holding a
+    list indexed by the line's occupancy bitmask (bit i set if position i is occupied).
+    Each entry is a tuple of five tuples of square offsets (position difference times
+    stride): the squares a Chariot can reach (empty squares plus the first occupied square
+    in each direction), the squares a Cannon can reach (empty squares plus the occupied
+    square found after jumping exactly one piece in each direction), the first occupied
+    squares only, the occupied squares found after one jump only, and the squares a
+    Cannon attacks (every square after the one jump up to and including the next occupied
+    square). The third and fourth are used to look outward from a square for the Chariots
+    and Cannons attacking it, the last by the attack maps.
+    """
+    shared = {}
+    table = []
+    for pos in range(length):
+        # each direction only depends on the occupancy on its own side of the slider, so
+        # scan each side once per occupancy of that side and combine the two
+        below = [scan_line(pos, -1, occupancy, length, stride) for occupancy in range(1 << pos)]
+        above = [scan_line(pos, 1, occupancy << (pos + 1), length, stride)
+                 for occupancy in range(1 << (length - pos - 1))]
+        # occupancies in increasing order: the bits above pos, then the slider's own bit
+        # (which changes nothing), then the bits below pos
+        entries = []
+        for high in above:
+            combined = [shared.setdefault(entry, entry) for entry in
+                        [(low[0] + high[0], low[1] + high[1], low[2] + high[2], low[3] + high[3],
+                          low[4] + high[4]) for low in below]]
+            entries += combined
+            entries += combined
+        table.append(entries)
+    return table
+
+
+def scan_line(pos, direction, occupancy, length, stride):
+    """
+    Looks along a line from position pos in one direction (-1 or 1) and returns the five
+    tuples of square offsets described in build_slide_table for that direction only.
+    """
+    chariot = []
+    cannon = []
+    blockers = []
+    screened = []
+    beyond_screen = []
+    other = pos + direction
+    while 0 <= other < length and not occupancy >> other & 1:
+        chariot.append((other - pos) * stride)
+        cannon.append((other - pos) * stride)
+        other += direction
+    if 0 <= other < length:
+        chariot.append((other - pos) * stride)
+        blockers.append((other - pos) * stride)
+        # skip over the screen and find the next occupied square
+        other += direction
+        while 0 <= other < length and not occupancy >> other & 1:
+            beyond_screen.append((other - pos) * stride)
+            other += direction
+        if 0 <= other < length:
+            cannon.append((other - pos) * stride)
+            screened.append((other - pos) * stride)
+            beyond_screen.append((other - pos) * stride)
+    return tuple(chariot), tuple(cannon), tuple(blockers), tuple(screened), tuple(beyond_screen)
+
+
+# Sliding tables for Chariot and Cannon, indexed [column][rank occupancy] and
+# [row][file occupancy]
+RANK_SLIDES = build_slide_table(9, RIGHT)
+FILE_SLIDES = build_slide_table(10, UP)
+
+
+def invert_table(table):
+    """
+    Reverses a move table: returns a list indexed by destination square holding a tuple
+    of the origin squares (or (origin, blocker) pairs) that reach it, so attackers of a
+    square can be found by looking outward from it.
+    """
+    inverted = [[] for square in range(BOARD_SIZE)]
+    for square in range(BOARD_SIZE):
+        for move in table[square]:
+            if isinstance(move, tuple):
+                inverted[move[0]].append((square, move[1]))
+            else:
+                inverted[move].append(square)
+    return [tuple(origins) for origins in inverted]
+
+
+# Attack tables: the squares a piece must stand on (with its blocker) to attack a square
+GENERAL_ATTACKS = {side: invert_table(GENERAL_MOVES[side]) for side in (RED, BLACK)}
+ADVISOR_ATTACKS = {side: invert_table(ADVISOR_MOVES[side]) for side in (RED, BLACK)}
+ELEPHANT_ATTACKS = {side: invert_table(ELEPHANT_MOVES[side]) for side in (RED, BLACK)}
+HORSE_ATTACKS = invert_table(HORSE_MOVES)
+SOLDIER_ATTACKS = {side: invert_table(SOLDIER_MOVES[side]) for side in (RED, BLACK)}
+
+# Zobrist hashing: a random 64-bit key for each piece code on each mailbox square (zero
+# for an empty square) and one for black being the player to move. A position's key is
+# the XOR of the keys of its pieces and side to move. The generator is seeded so keys
+# are the same in every run and can be stored.
+zobrist_random = random.Random(20200312)
+ZOBRIST_PIECES = [[0] * BOARD_SIZE] + [[zobrist_random.getrandbits(64) for square in range(BOARD_SIZE)]
+                                       for code in range(1, OFFBOARD)]
+ZOBRIST_BLACK_TO_MOVE = zobrist_random.getrandbits(64)
+del zobrist_random
+
+# Static evaluation: the material value of each piece type (indexed by type code; the
+# General is never captured, losing it is a mate) plus a piece-square value for where the
+# piece stands. Piece-square tables are given for red, ranks listed from black's back rank
+# (row 9) down to red's (row 0) as in FEN; black's are the same tables turned upside down.
+PIECE_VALUES = [0] * 8
+PIECE_VALUES[GENERAL] = 0
+PIECE_VALUES[ADVISOR] = 20
+PIECE_VALUES[ELEPHANT] = 20
+PIECE_VALUES[HORSE] = 40
+PIECE_VALUES[CHARIOT] = 90
+PIECE_VALUES[CANNON] = 45
+PIECE_VALUES[SOLDIER] = 10
+PIECE_SQUARE_TABLES = {
+    GENERAL: (
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, -4, -4, -4, 0, 0, 0),
+        (0, 0, 0, -2, -2, -2, 0, 0, 0),
+        (0, 0, 0, 0, 2, 0, 0, 0, 0),
+    ),
+    ADVISOR: (
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 2, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    ),
+    ELEPHANT: (
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, -2, 0, 0, 0, -2, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (-2, 0, 0, 0, 2, 0, 0, 0, -2),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    ),
+    HORSE: (
+        (0, -2, 2, 0, 2, 0, 2, -2, 0),
+        (2, 4, 6, 8, 4, 8, 6, 4, 2),
+        (2, 6, 8, 8, 8, 8, 8, 6, 2),
+        (2, 4, 6, 8, 8, 8, 6, 4, 2),
+        (0, 4, 6, 6, 6, 6, 6, 4, 0),
+        (0, 2, 4, 6, 6, 6, 4, 2, 0),
+        (0, 2, 4, 4, 4, 4, 4, 2, 0),
+        (0, 2, 4, 2, 6, 2, 4, 2, 0),
+        (0, 0, 2, 2, -4, 2, 2, 0, 0),
+        (0, -4, 0, 0, 0, 0, 0, -4, 0),
+    ),
+    CHARIOT: (
+        (4, 6, 4, 8, 8, 8, 4, 6, 4),
+        (6, 8, 6, 10, 12, 10, 6, 8, 6),
+        (4, 6, 4, 8, 10, 8, 4, 6, 4),
+        (4, 6, 4, 8, 8, 8, 4, 6, 4),
+        (4, 8, 6, 8, 8, 8, 6, 8, 4),
+        (4, 6, 6, 6, 6, 6, 6, 6, 4),
+        (2, 6, 4, 6, 6, 6, 4, 6, 2),
+        (0, 4, 2, 6, 6, 6, 2, 4, 0),
+        (0, 2, 2, 6, 0, 6, 2, 2, 0),
+        (-4, 2, 0, 4, 0, 4, 0, 2, -4),
+    ),
+    CANNON: (
+        (4, 4, 0, -4, -6, -4, 0, 4, 4),
+        (2, 2, 0, -4, -6, -4, 0, 2, 2),
+        (2, 2, 0, -2, 0, -2, 0, 2, 2),
+        (0, 0, 0, 0, 4, 0, 0, 0, 0),
+        (0, 0, 0, 0, 4, 0, 0, 0, 0),
+        (0, 2, 0, 2, 4, 2, 0, 2, 0),
+        (0, 0, 0, 0, 2, 0, 0, 0, 0),
+        (2, 0, 4, 2, 6, 2, 4, 0, 2),
+        (0, 2, 2, 0, 2, 0, 2, 2, 0),
+        (0, 0, 2, 4, 4, 4, 2, 0, 0),
+    ),
+    # soldiers are worth about double once they have crossed the river (and can move
+    # sideways), more still near the enemy palace, less on the last rank
+    SOLDIER: (
+        (4, 4, 4, 6, 8, 6, 4, 4, 4),
+        (10, 14, 18, 22, 24, 22, 18, 14, 10),
+        (10, 14, 16, 20, 22, 20, 16, 14, 10),
+        (10, 12, 14, 16, 18, 16, 14, 12, 10),
+        (10, 10, 12, 14, 14, 14, 12, 10, 10),
+        (0, 0, 2, 0, 4, 0, 2, 0, 0),
+        (0, 0, 0, 0, 2, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (0, 0, 0, 0, 0, 0, 0, 0, 0),
+    ),
+}
+
+
+def build_evaluation_table():
+    """
+    Returns, for each piece code, a list of the piece's value (material plus piece-square
+    value) on each mailbox square, positive for red pieces and negative for black ones.
+    Empty and off board squares are worth nothing.
+    """
+    table = [[0] * BOARD_SIZE for code in range(OFFBOARD)]
+    for piece_type, ranks in PIECE_SQUARE_TABLES.items():
+        for row in range(10):
+            for col in range(9):
+                value = PIECE_VALUES[piece_type] + ranks[9 - row][col]
+                table[RED | piece_type][loc_to_square((row, col))] = value
+                table[BLACK | piece_type][loc_to_square((9 - row, col))] = -value
+    return table
+
+
+EVALUATION_TABLE = build_evaluation_table()
+
+# FEN piece letters (upper case for red, lower case for black) and the start position.
+# Ranks are listed from black's back rank (row 9) down to red's (row 0).
+FEN_LETTERS = {GENERAL: 'k', ADVISOR: 'a', ELEPHANT: 'b', HORSE: 'n', CHARIOT: 'r', CANNON: 'c', SOLDIER: 'p'}
+FEN_CODES = {}
+for fen_type, fen_letter in FEN_LETTERS.items():
+    FEN_CODES[fen_letter.upper()] = RED | fen_type
+    FEN_CODES[fen_letter] = BLACK | fen_type
+# letters also found in Xiangqi FEN from other programs: G(eneral), E(lephant), H(orse)
+for fen_letter, fen_type in (('g', GENERAL), ('e', ELEPHANT), ('h', HORSE)):
+    FEN_CODES[fen_letter.upper()] = RED | fen_type
+    FEN_CODES[fen_letter] = BLACK | fen_type
+del fen_type, fen_letter
+START_FEN = 'rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w - - 0 1'
+
+# Legal moves of a demonstration game from the start position, played by main and by the
+# benchmark, load test and instrumentation tools
+DEMO_GAME = [('c1', 'e3'), ('e7', 'e6'), ('b1', 'd2'), ('h10', 'g8'), ('h1', 'i3'), ('g10', 'e8'), ('h3', 'g3'),
+             ('i7', 'i6'), ('i1', 'h1'), ('g7', 'g6'), ('d2', 'f3'), ('h8', 'i8'), ('d1', 'e2'), ('b8', 'd8'),
+             ('a1', 'd1'), ('b10', 'c8'), ('g4', 'g5'), ('d10', 'e9'), ('g5', 'g6'), ('g8', 'f6'), ('g3', 'g2'),
+             ('f6', 'e4'), ('d1', 'd4'), ('a10', 'b10'), ('d4', 'e4'), ('i8', 'i4'), ('e1', 'd1'), ('b10', 'b3'),
+             ('f3', 'e5'), ('i10', 'i7'), ('h1', 'h10'), ('e6', 'e5'), ('h10', 'f10'), ('e10', 'f10'), ('e4', 'i4')]
+
+# (row, column) tuple of each square in algebraic notation ('a1' to 'i10')
+ALGEBRAIC_LOCS = {chr(col + 97) + str(row + 1): (row, col) for row in range(0, 10) for col in range(0, 9)}
+
 
 class XiangqiGame:
     """
@@ -13,11 +408,22 @@ class XiangqiGame:
         """ Initializes game data members. """
         self._game_state = "UNFINISHED"
         # build empty board, 10 rows with 9 columns each
-        self._board = []
-        for row in range(10):
-            self._board.append([])
-            for col in range(9):
-                self._board[row].append("")
+        self._board = [[""] * 9 for row in range(10)]
+
+        # mailbox copy of the board holding piece codes, used for all occupancy tests
+        self._squares = empty_mailbox()
+        # occupancy bitmask of each row (bit = column) and each column (bit = row), used
+        # to look up Chariot and Cannon moves
+        self._ranks = [0] * 10
+        self._files = [0] * 9
+
+        # Zobrist key of the current position, kept up to date as squares change
+        self._key = 0
+        # static evaluation of the current position from red's point of view, kept up to
+        # date as squares change, see EVALUATION_TABLE
+        self._score = 0
+        # attack maps, see refresh_attacks
+        self.clear_attacks()
 
         self._red_pieces = []
         self._black_pieces = []
@@ -27,6 +433,32 @@ class XiangqiGame:
         self._gen_red_loc = (0,4)
         self._gen_black_loc = (9,4)
         self._player_turn = 'red'
+        # Move records (from_loc, to_loc, captured piece or None, game state before the
+        # move) for every move on the board, most recent last, used to unmake moves. Moves
+        # taken back with undo_move are kept as (from_loc, to_loc, game state after the
+        # move) so redo_move can replay them.
+        self._move_stack = []
+        self._redo_stack = []
+        # Zobrist keys of the starting position and of the position after each move on the
+        # move stack, and how many times each key appears in that history
+        self._key_history = [self._key]
+        self._key_counts = {self._key: 1}
+        # True while the four histories above are shared with a fork, see own_history
+        self._shared_history = False
+        # halfmove clock, fullmove number and player to move of the position the move stack
+        # starts from, used to work out the move counters of the current position
+        self._start_counters = (0, 1, 'red')
+        # functions called after each move made with make_move
+        self._observers = []
+        # names of the methods replaced on this game by add_method_wrapper
+        self._method_wrappers = set()
+        # (position key, frozenset of legal moves) of the last position whose legal moves
+        # were all worked out, see get_legal_moves
+        self._legal_moves = None
+        # None while the game's piece objects are its own; once the game has been forked
+        # (or is a fork), the set of pieces it has copied for itself since. The others are
+        # shared with other games and never changed, see own_piece
+        self._owned_pieces = None
 
     def set_board(self):
         """
@@ -68,17 +500,291 @@ class XiangqiGame:
         """
         piece = piece_class(player, row, col)
         self.update_loc(piece, (row, col))
-        # Add piece to list of red pieces or black pieces
-        self._red_pieces.append(piece) if player == 'red' else self._black_pieces.append(piece)
+        # Add piece to list of red pieces or black pieces, remembering its position in the list
+        pieces = self._red_pieces if player == 'red' else self._black_pieces
+        piece.set_index(len(pieces))
+        pieces.append(piece)
+
+    def load_position(self, codes, player_turn, halfmove_clock=0, fullmove_number=1):
+        """
+        Replaces the game's position with the given one: codes holds the mailbox code
+        (EMPTY, or piece type and player bits) of each of the 90 board squares in row order
+        (a1 to i1, a2 to i2, ..., a10 to i10) and player_turn is 'red' or 'black'. The move
+        counters start from halfmove_clock and fullmove_number. The move history is
+        cleared and the game state is computed once, after all pieces are placed. Raises
+        ValueError if a code is not a piece or if either player does not have exactly one
+        General.
+        """
+        if len(codes) != 90:
+            raise ValueError("expected 90 square codes, got " + str(len(codes)))
+        self._board = [[""] * 9 for row in range(10)]
+        self._squares = empty_mailbox()
+        self._ranks = [0] * 10
+        self._files = [0] * 9
+        self._key = 0
+        self._score = 0
+        self.clear_attacks()
+        self._red_pieces = []
+        self._black_pieces = []
+
+        generals = {'red': [], 'black': []}
+        for index in range(90):
+            code = codes[index]
+            if code == EMPTY:
+                continue
+            if code & TYPE_MASK == EMPTY or code & ~TYPE_MASK not in (RED, BLACK):
+                raise ValueError("invalid piece code " + str(code))
+            row, col = divmod(index, 9)
+            player = 'red' if code & RED else 'black'
+            self.set_piece(PIECE_CLASSES[code & TYPE_MASK], player, row, col)
+            if code & TYPE_MASK == GENERAL:
+                generals[player].append((row, col))
+        if len(generals['red']) != 1 or len(generals['black']) != 1:
+            raise ValueError("each player must have exactly one General")
+        self._gen_red_loc = generals['red'][0]
+        self._gen_black_loc = generals['black'][0]
+
+        self._player_turn = 'red'
+        if player_turn == 'black':
+            self.switch_turn()
+        self._move_stack = []
+        self._redo_stack = []
+        self._key_history = [self._key]
+        self._key_counts = {self._key: 1}
+        self._shared_history = False
+        self._start_counters = (halfmove_clock, fullmove_number, self._player_turn)
+        self._legal_moves = None
+        self._owned_pieces = None
+
+        self.update_game_state()
+
+    def fork(self):
+        """
+        Returns a new game in the same position, with the same move history and game state,
+        that can then be played independently of this one. The board, mailbox, attack maps
+        and piece lists are copied (one board-sized copy of each). The piece objects are
+        shared by both games until one of them moves, captures or restores a piece, when
+        that game copies the piece for itself (see own_piece), and the move, redo and key
+        histories are shared until one of them makes or unmakes a move (see own_history), so
+        forking takes the same time however long the game is. Observers are not carried
+        over to the fork, nor are method wrappers added with add_method_wrapper.
+        """
+        game = copy.copy(self)
+        for name in self._method_wrappers:
+            delattr(game, name)
+        game._method_wrappers = set()
+        game._board = [row[:] for row in self._board]
+        game._squares = self._squares[:]
+        game._ranks = self._ranks[:]
+        game._files = self._files[:]
+        game._attack_counts = {RED: self._attack_counts[RED][:], BLACK: self._attack_counts[BLACK][:]}
+        game._attacks = self._attacks[:]
+        game._attack_sides = self._attack_sides[:]
+        game._red_pieces = self._red_pieces[:]
+        game._black_pieces = self._black_pieces[:]
+        game._observers = []
+        # from now on neither game owns the pieces or histories they share
+        game._owned_pieces = set()
+        self._owned_pieces = set()
+        game._shared_history = True
+        self._shared_history = True
+        return game
+
+    def own_history(self):
+        """
+        Gives the game its own copies of the move, redo and key histories if it shares them
+        with a fork, before it changes them. The copies are made once, on the first move
+        made or unmade after forking.
+        """
+        if self._shared_history:
+            self._move_stack = self._move_stack[:]
+            self._redo_stack = self._redo_stack[:]
+            self._key_history = self._key_history[:]
+            self._key_counts = dict(self._key_counts)
+            self._shared_history = False
+
+    def own_piece(self, piece):
+        """
+        Returns a piece object this game may change in place of piece: piece itself unless
+        the game shares it with a fork, in which case piece is copied and the copy takes its
+        place on the board and in its player's piece list (if it is not captured).
+        """
+        owned = self._owned_pieces
+        if owned is None or piece in owned:
+            return piece
+        own = piece.copy()
+        row, col = own.get_loc()
+        if row is not None:
+            self._board[row][col] = own
+            pieces = self._red_pieces if own.get_player() == "red" else self._black_pieces
+            pieces[own.get_index()] = own
+        owned.add(own)
+        return own
+
+    def pack_position(self):
+        """
+        Returns the current position as 91 bytes: the mailbox code of each board square in
+        the order used by load_position, then 0 if red is to move or 1 if black is.
+        """
+        squares = self._squares
+        packed = bytearray(91)
+        for index in range(90):
+            packed[index] = squares[loc_to_square(divmod(index, 9))]
+        packed[90] = 0 if self._player_turn == 'red' else 1
+        return bytes(packed)
+
+    @classmethod
+    def unpack_position(cls, packed):
+        """ Returns a new game set up from a position packed by pack_position. """
+        game = cls()
+        game.set_packed_position(packed)
+        return game
+
+    def set_packed_position(self, packed):
+        """ Replaces the game's position with one packed by pack_position, as unpack_position does. """
+        self.load_position(packed[:90], 'red' if packed[90] == 0 else 'black')
+
+    @classmethod
+    def from_fen(cls, fen):
+        """
+        Returns a new game set up from a position in Xiangqi FEN, such as START_FEN: the
+        ranks from row 10 down to row 1 separated by '/', with red pieces in upper case
+        (K, A, B, N, R, C, P) and black in lower case and digits counting empty squares,
+        then the player to move ('w' or 'r' for red, 'b' for black) and optionally two
+        unused fields and the halfmove clock and fullmove number. No moves are replayed
+        and the game state is computed once. Raises ValueError if the FEN is malformed.
+        """
+        game = cls()
+        game.set_fen(fen)
+        return game
+
+    def set_fen(self, fen):
+        """ Replaces the game's position with one in Xiangqi FEN, as from_fen does. """
+        fields = fen.split()
+        if not fields:
+            raise ValueError("empty FEN")
+        ranks = fields[0].split('/')
+        if len(ranks) != 10:
+            raise ValueError("FEN must have 10 ranks, got " + str(len(ranks)))
+        codes = bytearray(90)
+        for rank_index in range(10):
+            # the first rank listed is row 9
+            index = (9 - rank_index) * 9
+            end = index + 9
+            for char in ranks[rank_index]:
+                if char.isdigit():
+                    index += int(char)
+                elif char in FEN_CODES:
+                    if index < end:
+                        codes[index] = FEN_CODES[char]
+                    index += 1
+                else:
+                    raise ValueError("invalid FEN piece " + repr(char))
+                if index > end:
+                    raise ValueError("FEN rank " + ranks[rank_index] + " is longer than 9 squares")
+            if index != end:
+                raise ValueError("FEN rank " + ranks[rank_index] + " is shorter than 9 squares")
+
+        side = fields[1].lower() if len(fields) > 1 else 'w'
+        if side not in ('w', 'r', 'b'):
+            raise ValueError("invalid FEN player to move " + fields[1])
+        player_turn = 'black' if side == 'b' else 'red'
+        try:
+            halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError("invalid FEN move counters " + " ".join(fields[4:6]))
+        self.load_position(codes, player_turn, halfmove_clock, fullmove_number)
+
+    def to_fen(self):
+        """ Returns the current position, player to move and move counters in Xiangqi FEN. """
+        squares = self._squares
+        ranks = []
+        for row in range(9, -1, -1):
+            rank = ""
+            empty = 0
+            for col in range(9):
+                code = squares[loc_to_square((row, col))]
+                if code == EMPTY:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                letter = FEN_LETTERS[code & TYPE_MASK]
+                rank += letter.upper() if code & RED else letter
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        side = 'w' if self._player_turn == 'red' else 'b'
+        return "/".join(ranks) + " " + side + " - - " + str(self.get_halfmove_clock()) + " " + \
+            str(self.get_fullmove_number())
+
+    def get_halfmove_clock(self):
+        """ Returns the number of moves (plies) made since the last capture. """
+        plies = 0
+        for record in reversed(self._move_stack):
+            if record[2] is not None:
+                return plies
+            plies += 1
+        return plies + self._start_counters[0]
+
+    def get_fullmove_number(self):
+        """ Returns the move number, which starts at 1 and goes up after each black move. """
+        fullmove_number, start_player = self._start_counters[1:]
+        # count the black moves on the move stack
+        plies = len(self._move_stack) + (1 if start_player == 'black' else 0)
+        return fullmove_number + plies // 2
 
     def update_loc(self, piece, loc):
-        """ Update board location to hold piece. """
-        self._board[loc[0]][loc[1]] = piece
+        """ Update board location (and its mailbox square and line occupancy) to hold piece. """
+        row, col = loc
+        square = loc_to_square(loc)
+        self._board[row][col] = piece
+        if piece == "":
+            code = EMPTY
+            self._ranks[row] &= ~(1 << col)
+            self._files[col] &= ~(1 << row)
+        else:
+            code = piece.get_code()
+            self._ranks[row] |= 1 << col
+            self._files[col] |= 1 << row
+        # swap the old square contents out of the position key and evaluation and the new
+        # contents in
+        old = self._squares[square]
+        self._key ^= ZOBRIST_PIECES[old][square] ^ ZOBRIST_PIECES[code][square]
+        self._score += EVALUATION_TABLE[code][square] - EVALUATION_TABLE[old][square]
+        self._squares[square] = code
+        # the attack maps around the square are brought up to date when next needed
+        self._dirty |= 1 << square
+
+    def update_game_state(self):
+        """
+        Sets the game state from the current position, for positions set up without
+        make_move: the player to move has lost if they have no valid move (checkmate or
+        stalemate), otherwise the game is unfinished. Returns the game state.
+        """
+        self._game_state = "UNFINISHED"
+        if self.check_player_moves(self._player_turn) is False:
+            self._game_state = "BLACK_WON" if self._player_turn == 'red' else "RED_WON"
+        return self._game_state
 
     def get_game_state(self):
         """ Returns "UNFINISHED', 'RED_WON', or 'BLACK_WON' based on current game status."""
         return self._game_state
 
+    def get_player_turn(self):
+        """ Returns 'red' or 'black', the player whose turn it is. """
+        return self._player_turn
+
+    def get_pieces(self, player):
+        """ Returns the list of pieces 'red' or 'black' has on the board. """
+        return self._red_pieces if player == 'red' else self._black_pieces
+
+    def get_code(self, square):
+        """ Returns the mailbox code (piece type and player bits, or EMPTY) of a mailbox square. """
+        return self._squares[square]
+
     def str_to_tuple(self, loc):
         """
         Converts square location from algebraic notation to integer tuple (row, column).
@@ -92,13 +798,19 @@ class XiangqiGame:
             return False
         return row, col
 
-    def make_move(self, from_loc_alg, to_loc_alg):
+    def tuple_to_str(self, loc):
+        """ Converts integer tuple (row, column) to square location in algebraic notation. """
+        return chr(loc[1] + 97) + str(loc[0] + 1)
+
+    def make_move(self, from_loc_alg, to_loc_alg, evaluate=True):
         """
         Takes two parameters which are strings that represent the square moved from and
         the square moved to. Returns False if move is not legal, if square is not occupied
         by current player, or if game has been won.
         If valid move, returns True after move is made, captured piece removed, game
         status updated, and player turn is updated.
+        If evaluate is False, the game status is not updated and observers are not called:
+        the caller must call update_game_state before the game is used again.
         """
         if self._game_state != "UNFINISHED":
             return False
@@ -111,8 +823,51 @@ class XiangqiGame:
         if from_loc is False or to_loc is False:
             return False
 
+        if not self.is_legal_move(from_loc, to_loc):
+            return False
+
+        # make move and capture opponent piece (if one exists)
+        self.push_move(from_loc, to_loc)
+        # a new move makes any taken back moves unreachable
+        self._redo_stack = []
+
+        if not evaluate:
+            return True
+
+        # Evaluate for checkmate and stalemate: the move has passed the turn to the
+        # opponent, check all opponent moves, if no move gets opponent general out of
+        # check (checkmate) or if all opponent moves place their player in check
+        # (stalemate), player wins
+        if self._player_turn == "black":
+            test = self.check_player_moves("black")
+            if test is False:
+                self._game_state = "RED_WON"
+        else:
+            test = self.check_player_moves('red')
+            if test is False:
+                self._game_state = "BLACK_WON"
+
+        # let observers (such as a renderer) know about the move
+        for observer in self._observers:
+            observer(self, from_loc_alg, to_loc_alg)
+
+        # If all went smoothly with make-move, return True
+        return True
+
+    def is_legal_move(self, from_loc, to_loc):
+        """
+        Returns True if moving the piece at from_loc to to_loc ((row, column) tuples) is a
+        legal move for the player to move, otherwise returns False. Does not look at the
+        game state.
+        """
+        legal_moves = self._legal_moves
+        if legal_moves is not None and legal_moves[0] == self._key:
+            # the legal moves of this position are known (see get_legal_moves), so the
+            # move is valid if it is one of them
+            return (from_loc, to_loc) in legal_moves[1]
+
         # return False if 'from' location empty
-        if self._board[from_loc[0]][from_loc[1]] == "":
+        if self.is_occupied(from_loc) is False:
             return False
         # assign piece object at from_loc to 'piece' variable
         piece = self._board[from_loc[0]][from_loc[1]]
@@ -121,116 +876,518 @@ class XiangqiGame:
         if piece.get_player() != self._player_turn:
             return False
 
-        # set up opponent piece (if opponent piece exists)
-        opponent_piece = None
-        if self.is_occupied(to_loc):
-            if self.occupied_by_opponent(piece, to_loc) is True:
-                opponent_piece = self._board[to_loc[0]][to_loc[1]]
-            # Return False if to_loc is occupied by current player
-            else:
-                return False
+        # Return False if to_loc is occupied by current player
+        if self.is_occupied(to_loc) and not self.occupied_by_opponent(piece, to_loc):
+            return False
 
         # Get list of all valid moves for piece
         valid_moves = self.get_valid_moves(piece)
 
         # test to_loc to see if it puts current player in check
         if to_loc in valid_moves:
-            test = self.test_move(piece, from_loc, to_loc, opponent_piece)
+            test = self.test_move(piece, from_loc, to_loc)
             if test is False:
                 return False
-            # if test_move is True, make move and capture opponent piece
-            else:
-                self.mov_piece(piece, from_loc, to_loc)
-                # capture opponent piece if opponent piece exists
-                if opponent_piece is not None:
-                    self.capture_piece(opponent_piece)
         else:
             # return false if to_loc not in valid moves
             return False
 
-        # Evaluate for checkmate and stalemate: check all opponent moves, if no move gets
-        # opponent general out of check (checkmate) or if all opponent moves place their
-        # player in check (stalemate), player wins
-        if self._player_turn == "red":
-            test = self.check_player_moves("black")
-            if test is False:
-                self._game_state = "RED_WON"
+        return True
 
-        if self._player_turn == "black":
-            test = self.check_player_moves('red')
-            if test is False:
-                self._game_state = "BLACK_WON"
+    def apply_moves(self, moves, verify="full", checkpoints=None):
+        """
+        Makes a sequence of moves given as algebraic (from, to) pairs, such as [('c1', 'e3'),
+        ('e7', 'e6')], and returns the index of the first move that failed (which, like
+        every move after it, is not made), or None if all were made. All squares are
+        parsed before any move is made. verify sets how much each move is checked:
+          "full"       as make_move: the move must be legal and the game unfinished, and
+                       the game state is brought up to date after every move
+          "legality"   the move must be legal, the game state is only brought up to date
+                       after the moves listed in checkpoints and after the last move made
+                       (no legal move is left once a game has ended, so a move made after
+                       the end still fails)
+          "trusted"    the moves are not checked against the rules, the game state is
+                       only brought up to date at the checkpoints and at the end; only
+                       malformed squares and moves that do not start from a piece of the
+                       player to move, or that land on one of their own pieces or on a
+                       general, fail
+        checkpoints lists move counts (such as 20 for after the 20th move of the list)
+        after which the game state is brought up to date; a move after a checkpoint that
+        finds the game ended fails. Observers are not called. A malformed square fails
+        its move under every verify level.
+        """
+        if verify not in ("full", "legality", "trusted"):
+            raise ValueError("verify must be 'full', 'legality' or 'trusted'")
+        # parse every square up front, stopping at the first malformed one
+        parsed = []
+        malformed = False
+        for from_str, to_str in moves:
+            from_loc = ALGEBRAIC_LOCS.get(from_str)
+            to_loc = ALGEBRAIC_LOCS.get(to_str)
+            if from_loc is None or to_loc is None:
+                malformed = True
+                break
+            parsed.append((from_loc, to_loc))
+
+        if parsed:
+            # new moves make any taken back moves unreachable
+            self._redo_stack = []
+        checkpoints = frozenset(checkpoints or ())
+        check = verify != "trusted"
+        squares = self._squares
+        for index, (from_loc, to_loc) in enumerate(parsed):
+            if self._game_state != "UNFINISHED" or (check and not self.is_legal_move(from_loc, to_loc)):
+                failed = index
+                break
+            if not check:
+                # even a trusted move must move a piece of the player to move, and not onto
+                # another of their pieces or a general, or push_move would corrupt the board
+                side = RED if self._player_turn == "red" else BLACK
+                target = squares[loc_to_square(to_loc)]
+                if not squares[loc_to_square(from_loc)] & side or target & side or target & TYPE_MASK == GENERAL:
+                    failed = index
+                    break
+            self.push_move(from_loc, to_loc)
+            if verify == "full" or index + 1 in checkpoints:
+                self.update_game_state()
+        else:
+            failed = len(parsed) if malformed else None
+
+        # the end-of-game scan deferred to the end
+        if verify != "full":
+            self.update_game_state()
+        return failed
+
+    def add_observer(self, observer):
+        """
+        Adds a function to call after every move made with make_move, as
+        observer(game, from_loc_alg, to_loc_alg), once the game state has been updated.
+        Games have no observers by default and print nothing; add board_printer to print
+        the board after each of black's moves.
+        """
+        self._observers.append(observer)
+
+    def remove_observer(self, observer):
+        """ Removes a function added with add_observer. """
+        self._observers.remove(observer)
+
+    def add_method_wrapper(self, name, wrapper):
+        """
+        Replaces the method called name on this game only with wrapper, a function taking
+        the method's arguments (which usually calls the method it replaces, for timing or
+        tracing, see XiangqiInstrument). Calls the game makes to its own methods go through
+        the wrapper too. Forks of the game do not inherit it.
+        """
+        setattr(self, name, wrapper)
+        self._method_wrappers.add(name)
+
+    def remove_method_wrapper(self, name):
+        """ Removes a wrapper added with add_method_wrapper, restoring the class's method. """
+        delattr(self, name)
+        self._method_wrappers.discard(name)
+
+    def undo_move(self):
+        """
+        Takes back the last move made with make_move: moves the piece back, restores any
+        captured piece, and restores the game state and player turn. The move can be
+        replayed with redo_move. Returns False if there is no move to take back,
+        otherwise returns True.
+        """
+        if not self._move_stack:
+            return False
+        game_state = self._game_state
+        from_loc, to_loc = self.pop_move()[:2]
+        self._redo_stack.append((from_loc, to_loc, game_state))
+        return True
+
+    def redo_move(self):
+        """
+        Replays the last move taken back with undo_move, without checking it again.
+        Returns False if there is no move to replay, otherwise returns True.
+        """
+        if not self._redo_stack:
+            return False
+        self.own_history()
+        from_loc, to_loc, game_state = self._redo_stack.pop()
+        self.push_move(from_loc, to_loc)
+        self._game_state = game_state
+        return True
+
+    def position_key(self):
+        """
+        Returns the 64-bit Zobrist key of the current position (piece placement and
+        player to move). Equal positions have equal keys.
+        """
+        return self._key
+
+    def get_score(self):
+        """
+        Returns the static evaluation of the position, positive when red is ahead: the
+        material and piece-square values (see EVALUATION_TABLE) of red's pieces less those
+        of black's. Kept up to date as pieces move, so reading it costs nothing.
+        """
+        return self._score
+
+    def evaluate(self):
+        """ Returns the static evaluation of the position from the point of view of the player to move. """
+        return self._score if self._player_turn == 'red' else -self._score
+
+    def repetition_count(self):
+        """
+        Returns how many times the current position (same key) has occurred in the game,
+        counting the current occurrence.
+        """
+        return self._key_counts[self._key]
 
-        # Change turns
+    def get_move_history(self):
+        """
+        Returns a list of the (from_loc, to_loc) tuples of the moves on the board, oldest
+        first.
+        """
+        return [record[:2] for record in self._move_stack]
+
+    def get_key_history(self):
+        """
+        Returns the list of Zobrist keys of the starting position and of the position after
+        each move on the board. The list is the game's own and must not be modified.
+        """
+        return self._key_history
+
+    def switch_turn(self):
+        """ Passes the turn to the other player and updates the position key to match. """
         if self._player_turn == "red":
             self._player_turn = "black"
         else:
             self._player_turn = "red"
-            self.print_board()
+        self._key ^= ZOBRIST_BLACK_TO_MOVE
 
-        # If all went smoothly with make-move, return True
-        return True
+    def push_move(self, from_loc, to_loc):
+        """
+        Makes a move on the board without checking it: moves the piece at from_loc to
+        to_loc, captures any piece found there, passes the turn to the other player, and
+        records the move on the move stack so it can be unmade with pop_move. Does not
+        change the game state.
+        """
+        if self._shared_history:
+            self.own_history()
+        piece = self._board[from_loc[0]][from_loc[1]]
+        captured = self._board[to_loc[0]][to_loc[1]]
+        if captured == "":
+            captured = None
+        elif self._owned_pieces is not None:
+            # the move record keeps the captured piece, so it must be this game's own
+            captured = self.own_piece(captured)
+        # the move is recorded once it is on the board, so a move from an empty square
+        # (which fails in mov_piece before changing anything) leaves no record behind
+        self.mov_piece(piece, from_loc, to_loc)
+        if captured is not None:
+            self.capture_piece(captured)
+        self._move_stack.append((from_loc, to_loc, captured, self._game_state))
+        self.switch_turn()
+        # add new position to the key history
+        key = self._key
+        self._key_history.append(key)
+        self._key_counts[key] = self._key_counts.get(key, 0) + 1
+
+    def pop_move(self):
+        """
+        Unmakes the most recent move on the move stack: moves the piece back, puts any
+        captured piece back on the board and in its player's piece list, and restores the
+        player turn and game state. Returns the move record.
+        """
+        if self._shared_history:
+            self.own_history()
+        # remove position from the key history
+        key = self._key_history.pop()
+        if self._key_counts[key] == 1:
+            del self._key_counts[key]
+        else:
+            self._key_counts[key] -= 1
+
+        self.switch_turn()
+        record = self._move_stack.pop()
+        from_loc, to_loc, captured, game_state = record
+        self.mov_piece(self._board[to_loc[0]][to_loc[1]], to_loc, from_loc)
+        if captured is not None:
+            self.restore_piece(captured, to_loc)
+        self._game_state = game_state
+        return record
 
     def is_in_check(self, player):
         """
         Takes as a parameter either 'red' or 'black' and returns True if that
         player is in check, otherwise returns False.
         """
-        # Iterate through opponent player pieces and check their valid move locations,
-        # if player's general's location is in one of their opponent's piece's valid
-        # locations, the player is in check.
+        # Look up the opponent attackers of the player's general in the attack maps. This
+        # includes the flying general scenario (generals in the same column with no
+        # pieces between them). If the maps are out of date, look outward from the general
+        # instead: that costs about a tenth of a refresh, which is left to the callers
+        # that need the full maps.
+        if self._dirty:
+            if player not in ('red', 'black'):
+                return False
+            return self.is_general_attacked(player)
         if player == 'red':
-            for piece in self._black_pieces:
-                valid_moves = self.get_valid_moves(piece)
-                if self._gen_red_loc in valid_moves:
-                    return True
+            return self._attack_counts[BLACK][loc_to_square(self._gen_red_loc)] != 0
         if player == 'black':
-            for piece in self._red_pieces:
-                valid_moves = self.get_valid_moves(piece)
-                if self._gen_black_loc in valid_moves:
-                    return True
-        # Check for flying general scenario. If generals are in the same column, check
-        # the squares between them for a piece, if piece found, return False (not in check)
-        if self._gen_red_loc[1] == self._gen_black_loc[1]:
-            flying_general = True
-            for row in range(self._gen_red_loc[0] + 1, self._gen_black_loc[0]):
-                if self._board[row][self._gen_red_loc[1]] != "":
-                    flying_general = False
-            return flying_general
+            return self._attack_counts[RED][loc_to_square(self._gen_black_loc)] != 0
         # return False if player not in check
         return False
 
+    def is_general_attacked(self, player):
+        """
+        Same as is_in_check, but always looks outward from the player's general for an
+        attacker instead of reading the attack maps, which is what is_in_check does when
+        the maps are out of date.
+        """
+        if player == 'red':
+            return self.is_square_attacked(loc_to_square(self._gen_red_loc), BLACK)
+        return self.is_square_attacked(loc_to_square(self._gen_black_loc), RED)
+
+    def attackers_of(self, square, side):
+        """
+        Returns a list of the mailbox squares of the pieces of side (RED or BLACK) that
+        attack the mailbox square: pieces that could capture on it if it held an opponent
+        piece, so pieces defending their own pieces are included. A General attacks along
+        its column only if the opposing General is the first piece it meets.
+        """
+        if self._dirty:
+            self.refresh_attacks()
+        if not self._attack_counts[side][square]:
+            return []
+        attacks = self._attacks
+        pieces = self._red_pieces if side == RED else self._black_pieces
+        return [piece.get_square() for piece in pieces if square in attacks[piece.get_square()]]
+
+    def attack_count(self, square, side):
+        """ Returns the number of pieces of side (RED or BLACK) attacking the mailbox square. """
+        if self._dirty:
+            self.refresh_attacks()
+        return self._attack_counts[side][square]
+
+    def clear_attacks(self):
+        """ Empties the attack maps, for a board that is about to be filled with update_loc. """
+        # for each side, the number of its pieces attacking each mailbox square
+        self._attack_counts = {RED: bytearray(BOARD_SIZE), BLACK: bytearray(BOARD_SIZE)}
+        # the squares attacked by the piece on each square, as counted in the attack maps,
+        # and that piece's side
+        self._attacks = [()] * BOARD_SIZE
+        self._attack_sides = bytearray(BOARD_SIZE)
+        # bitmask (bit = mailbox square) of the squares changed since the attack maps were
+        # last refreshed
+        self._dirty = 0
+
+    def refresh_attacks(self):
+        """
+        Brings the attack maps up to date with the squares changed since the last refresh.
+        Only the pieces whose attacks can depend on a changed square are recomputed: the
+        piece on the square itself, Chariots and Cannons that reach it along its row or
+        column, Generals that face it along its column (the flying general), Horses whose
+        leg it is (orthogonally adjacent) and Elephants whose eye it is (diagonally
+        adjacent).
+        """
+        squares = self._squares
+        ranks = self._ranks
+        files = self._files
+        affected = set()
+        dirty = self._dirty
+        while dirty:
+            low = dirty & -dirty
+            dirty ^= low
+            square = low.bit_length() - 1
+            affected.add(square)
+            # a slider's attacks only change if the square is within its reach: the first
+            # occupied square in each direction from the square (a Chariot, Cannon or
+            # General) or the second (a Cannon)
+            row, col = square_to_loc(square)
+            along_rank = RANK_SLIDES[col][ranks[row]]
+            along_file = FILE_SLIDES[row][files[col]]
+            for offset in along_rank[2] + along_rank[3] + along_file[3]:
+                if squares[square + offset] & TYPE_MASK in (CHARIOT, CANNON):
+                    affected.add(square + offset)
+            for offset in along_file[2]:
+                if squares[square + offset] & TYPE_MASK in (CHARIOT, CANNON, GENERAL):
+                    affected.add(square + offset)
+            for step in ORTHOGONALS:
+                if squares[square + step] & TYPE_MASK == HORSE:
+                    affected.add(square + step)
+            for step in DIAGONALS:
+                if squares[square + step] & TYPE_MASK == ELEPHANT:
+                    affected.add(square + step)
+        self._dirty = 0
+
+        counts = self._attack_counts
+        attacks = self._attacks
+        sides = self._attack_sides
+        for square in affected:
+            # remove the attacks counted for the square (by the piece that was there)
+            if attacks[square]:
+                side_counts = counts[sides[square]]
+                for target in attacks[square]:
+                    side_counts[target] -= 1
+            code = squares[square]
+            if code == EMPTY:
+                attacks[square] = ()
+                continue
+            targets = self.piece_attacks(square, code)
+            side = code & ~TYPE_MASK
+            side_counts = counts[side]
+            for target in targets:
+                side_counts[target] += 1
+            attacks[square] = targets
+            sides[square] = side
+
+    def piece_attacks(self, square, code):
+        """
+        Returns a tuple of the mailbox squares attacked by a piece with mailbox code
+        standing on the mailbox square, including squares held by its own pieces.
+        """
+        kind = code & TYPE_MASK
+        side = code & ~TYPE_MASK
+        squares = self._squares
+        if kind == HORSE:
+            return tuple(move for move, leg in HORSE_MOVES[square] if squares[leg] == EMPTY)
+        if kind == SOLDIER:
+            return SOLDIER_MOVES[side][square]
+        if kind == ELEPHANT:
+            return tuple(move for move, eye in ELEPHANT_MOVES[side][square] if squares[eye] == EMPTY)
+        if kind == ADVISOR:
+            return ADVISOR_MOVES[side][square]
+        row, col = square_to_loc(square)
+        along_file = FILE_SLIDES[row][self._files[col]]
+        if kind == GENERAL:
+            # the General also attacks the opposing General if nothing stands between them
+            opposing = (RED | BLACK) ^ side | GENERAL
+            return GENERAL_MOVES[side][square] + tuple(square + offset for offset in along_file[2]
+                                                       if squares[square + offset] == opposing)
+        along_rank = RANK_SLIDES[col][self._ranks[row]]
+        if kind == CHARIOT:
+            return tuple(square + offset for offset in along_rank[0] + along_file[0])
+        # a Cannon attacks the squares it could capture on if they were occupied, after one
+        # screen
+        return tuple(square + offset for offset in along_rank[4] + along_file[4])
+
+    def is_square_attacked(self, square, side):
+        """
+        Returns True if the mailbox square is attacked by any piece of side (RED or
+        BLACK), otherwise returns False. Instead of generating every move of that side,
+        starts at the square and looks outward for an attacker: the first pieces along
+        the row and column (Chariot, or the General if the square holds the opposing
+        General), the pieces behind one screen (Cannon), then the horse, soldier,
+        advisor, elephant and general squares, taking the horse leg and elephant eye
+        into account.
+        """
+        squares = self._squares
+        row, col = square_to_loc(square)
+        along_rank = RANK_SLIDES[col][self._ranks[row]]
+        along_file = FILE_SLIDES[row][self._files[col]]
+
+        # Chariots (and the flying general) attack from the first occupied square
+        chariot = side | CHARIOT
+        for offset in along_rank[2]:
+            if squares[square + offset] == chariot:
+                return True
+        general = side | GENERAL
+        flying_general = squares[square] & TYPE_MASK == GENERAL
+        for offset in along_file[2]:
+            code = squares[square + offset]
+            if code == chariot or (flying_general and code == general):
+                return True
+
+        # Cannons attack from the occupied square after one screen
+        cannon = side | CANNON
+        for offset in along_rank[3] + along_file[3]:
+            if squares[square + offset] == cannon:
+                return True
+
+        # Horses attack unless their leg is blocked
+        horse = side | HORSE
+        for origin, leg in HORSE_ATTACKS[square]:
+            if squares[origin] == horse and squares[leg] == EMPTY:
+                return True
+
+        soldier = side | SOLDIER
+        for origin in SOLDIER_ATTACKS[side][square]:
+            if squares[origin] == soldier:
+                return True
+
+        advisor = side | ADVISOR
+        for origin in ADVISOR_ATTACKS[side][square]:
+            if squares[origin] == advisor:
+                return True
+
+        elephant = side | ELEPHANT
+        for origin, eye in ELEPHANT_ATTACKS[side][square]:
+            if squares[origin] == elephant and squares[eye] == EMPTY:
+                return True
+
+        for origin in GENERAL_ATTACKS[side][square]:
+            if squares[origin] == general:
+                return True
+
+        return False
+
     def get_valid_moves(self, piece):
         """
         Gets potential move locations from the piece object and uses that information in
         combination with the current board state to return a set of valid moves for that
         pieces.
         """
-        valid_moves = set()
+        return {square_to_loc(square) for square in self.get_piece_moves(piece)}
 
-        potential_moves = piece.get_movements(self._board)
-        for move in potential_moves:
-            if self.is_occupied(move) is False or self.occupied_by_opponent(piece, move) is True:
-                valid_moves.add(move)
-
-        return valid_moves
+    def get_piece_moves(self, piece):
+        """
+        Same as get_valid_moves, but works on mailbox square indexes instead of (row,
+        column) tuples. Returns a list of squares that are empty or held by the opponent.
+        """
+        squares = self._squares
+        # a square is blocked if it holds one of the piece's own player's pieces
+        own = piece.get_side()
+        return [square for square in piece.get_movements(squares, self._ranks, self._files)
+                if not squares[square] & own]
 
     def is_occupied(self, loc_tup):
         """ Returns True if location is occupied by any piece. """
-        return self._board[loc_tup[0]][loc_tup[1]] != ""
+        return self._squares[loc_to_square(loc_tup)] != EMPTY
 
     def occupied_by_opponent(self, piece, loc_tup):
         """ Returns True if location is occupied by opponent. """
-        return self.is_occupied(loc_tup) \
-               and self._board[loc_tup[0]][loc_tup[1]].get_player() != piece.get_player()
+        code = self._squares[loc_to_square(loc_tup)]
+        return code != EMPTY and not code & piece.get_side()
 
     def capture_piece(self, piece):
         """ Captures opponent piece. Updates piece loc to None and updates player piece list."""
         piece.set_loc((None, None))
-        if piece.get_player() == "red":
-            self._red_pieces.remove(piece)
+        pieces = self._red_pieces if piece.get_player() == "red" else self._black_pieces
+        if self._owned_pieces is not None:
+            self.own_piece(pieces[-1])
+        # remove piece in O(1) by moving the last piece of the list into its place
+        last = pieces.pop()
+        if last is not piece:
+            pieces[piece.get_index()] = last
+            last.set_index(piece.get_index())
+
+    def restore_piece(self, piece, loc):
+        """
+        Reverses capture_piece: puts piece back on the board at loc and back at its old
+        position in its player's piece list (moving the piece that took its place back to
+        the end of the list).
+        """
+        if self._owned_pieces is not None:
+            piece = self.own_piece(piece)
+        self.update_loc(piece, loc)
+        piece.set_loc(loc)
+        pieces = self._red_pieces if piece.get_player() == "red" else self._black_pieces
+        index = piece.get_index()
+        if index == len(pieces):
+            pieces.append(piece)
         else:
-            self._black_pieces.remove(piece)
+            moved = pieces[index]
+            if self._owned_pieces is not None:
+                moved = self.own_piece(moved)
+            moved.set_index(len(pieces))
+            pieces.append(moved)
+            pieces[index] = piece
 
     def check_player_moves(self, player):
         """
@@ -238,56 +1395,96 @@ class XiangqiGame:
         valid move that does not place the player's general in check, otherwise
         returns False.
         """
-        if player == "red":
-            pieces_list = self._red_pieces
-        else:
-            pieces_list = self._black_pieces
-
-        # Iterate through each piece in player piece list and test each piece's
-        # available moves for validity
-        for piece in pieces_list:
-            from_loc = piece.get_loc()
-            available_moves = self.get_valid_moves(piece)
-            for move in available_moves:
-                opp_piece = None
-                # if occupied by opponent, assign opponent piece to piece located
-                # at move location square
-                if self.occupied_by_opponent(piece, move):
-                    opp_piece = self._board[move[0]][move[1]]
-                # run test move
-                test = self.test_move(piece, from_loc, move, opp_piece)
-                # return True once any valid move is found
-                if test is True:
-                    return True
+        legal_moves = self._legal_moves
+        if player == self._player_turn and legal_moves is not None and legal_moves[0] == self._key:
+            return len(legal_moves[1]) > 0
+        # return True as soon as the first valid move is found
+        for move in self.iter_legal_moves(player, algebraic=False):
+            return True
         # return False if all available moves do not provide a valid move
         return False
 
-    def test_move(self, piece, from_loc, to_loc, opponent_piece):
+    def get_legal_moves(self):
+        """
+        Returns a frozenset of the legal moves of the player to move as (from_loc, to_loc)
+        tuples. The set is worked out once per position and kept, keyed by the position
+        key, so asking again costs nothing and make_move validates a move in this position
+        with a set lookup. Any change of position (a move, undo_move, load_position)
+        changes the key, so a kept set is never used for another position.
+        """
+        legal_moves = self._legal_moves
+        if legal_moves is None or legal_moves[0] != self._key:
+            legal_moves = (self._key, frozenset(self.iter_legal_moves(algebraic=False)))
+            self._legal_moves = legal_moves
+        return legal_moves[1]
+
+    def book_moves(self, book):
+        """
+        Returns the moves an opening book (such as XiangqiBook.OpeningBook) has for the
+        current position, most played first, as a list of (from, to, games, score) tuples
+        with squares in algebraic notation: games is the number of games the move was
+        played in and score the share of points the player to move went on to score (a
+        win counts 1, an unfinished game 1/2). A book move that is not legal here (two
+        positions with the same key) is left out.
+        """
+        moves = []
+        for from_loc, to_loc, games, red_wins, black_wins in book.lookup(self._key):
+            if not self.is_legal_move(from_loc, to_loc):
+                continue
+            wins = red_wins if self._player_turn == 'red' else black_wins
+            score = (wins + (games - red_wins - black_wins) / 2) / games
+            moves.append((self.tuple_to_str(from_loc), self.tuple_to_str(to_loc), games, score))
+        return moves
+
+    def iter_legal_moves(self, player=None, from_loc=None, algebraic=True):
+        """
+        Generator yielding the legal moves of player ('red' or 'black', default the
+        player whose turn it is) as (from, to) pairs, one at a time: each move is only
+        tested when it is requested, so callers can stop early. If from_loc is given
+        (algebraic string or (row, column) tuple), only the moves of the piece on that
+        square are yielded. Squares are yielded in algebraic notation, or as (row, column)
+        tuples if algebraic is False. The game must not be changed while iterating.
+        """
+        if player is None:
+            player = self._player_turn
+        if from_loc is None:
+            # copy, captures made while testing moves reorder the list
+            pieces = list(self.get_pieces(player))
+        else:
+            if isinstance(from_loc, str):
+                from_loc = self.str_to_tuple(from_loc)
+            if from_loc is False or not self.is_occupied(from_loc):
+                return
+            piece = self._board[from_loc[0]][from_loc[1]]
+            if piece.get_player() != player:
+                return
+            pieces = [piece]
+
+        for piece in pieces:
+            from_loc = piece.get_loc()
+            for square in self.get_piece_moves(piece):
+                to_loc = square_to_loc(square)
+                if self.test_move(piece, from_loc, to_loc):
+                    if algebraic:
+                        yield self.tuple_to_str(from_loc), self.tuple_to_str(to_loc)
+                    else:
+                        yield from_loc, to_loc
+
+    def test_move(self, piece, from_loc, to_loc):
         """
         Used to test a move only, returns game to previous state before move.
         Makes a move and tests to see if that move places that player's general in
-        check, then reverses the move.
+        check, then unmakes the move.
         Returns False if test move places general in check, otherwise returns True.
         """
-        # move piece from from_loc to to_loc
-        self.mov_piece(piece, from_loc, to_loc)
-        # capture opponent piece
-        if opponent_piece is not None:
-            self.capture_piece(opponent_piece)
+        # move piece from from_loc to to_loc, capturing any opponent piece there
+        self.push_move(from_loc, to_loc)
 
         # test if player is in check after making move
-        test = self.is_in_check(piece.get_player())
-
-        # put player piece back
-        self.mov_piece(piece, to_loc, from_loc)
-        # put opponent piece back
-        if opponent_piece is not None:
-            self.update_loc(opponent_piece, to_loc)
-            opponent_piece.set_loc(to_loc)
-            if opponent_piece.get_player() == "red":
-                self._red_pieces.append(opponent_piece)
-            else:
-                self._black_pieces.append(opponent_piece)
+        test = self.is_general_attacked(piece.get_player())
+
+        # put player piece (and any captured opponent piece) back
+        self.pop_move()
 
         # if making the move placed the current player in check (in-check test is True),
         # it is not a valid move and function returns False
@@ -302,6 +1499,8 @@ class XiangqiGame:
         board to_loc square to hold piece, empties from_loc square, if piece is a
         General, updates game general location.
         """
+        if self._owned_pieces is not None:
+            piece = self.own_piece(piece)
         # set piece's location
         piece.set_loc(to_loc)
 
@@ -347,16 +1546,25 @@ class XiangqiGame:
 class Piece:
     """
     Parent class for Xiangqi pieces. Sets up basic data members and basic methods.
+    Pieces use __slots__ and keep their id, piece type and boundaries on the class, so a
+    piece only stores its own location, list index and player.
     """
+    __slots__ = ('_player', '_row', '_col', '_square', '_index', '_side', '_code')
+    _id = None
+    _type = EMPTY
+    # squares each player's pieces of the class may stand on, shared by all its pieces
+    _BOUNDARIES = {RED: BOARD_SQUARES, BLACK: BOARD_SQUARES}
+
     def __init__(self, player, row, col):
         """ Initialize piece data members. """
         self._player = player
         self._row = row
         self._col = col
-        self._id = None
-
-        # set of all possible tuples for board
-        self._boundaries = {(row,col) for row in range(0,10) for col in range(0,9)}
+        self._square = loc_to_square((row, col))
+        self._index = None
+        # mailbox player bit, combined with the class's piece type to form the piece's code
+        self._side = RED if player == 'red' else BLACK
+        self._code = self._side | self._type
 
     def __repr__(self):
         """ Display object player + id when printing piece objects. """
@@ -369,20 +1577,57 @@ class Piece:
         """ Return piece id. """
         return self._id
 
+    def get_code(self):
+        """ Return the mailbox code for piece (piece type and player bits). """
+        return self._code
+
+    def get_side(self):
+        """ Return the mailbox player bit for piece (RED or BLACK). """
+        return self._side
+
     def get_loc(self):
         """ Return piece location as a tuple. """
         return self._row, self._col
 
+    def get_square(self):
+        """ Return piece location as a mailbox square index. """
+        return self._square
+
+    def get_index(self):
+        """ Return piece's position in its player's piece list. """
+        return self._index
+
+    def copy(self):
+        """ Return a new piece of the same class with the same player, location and list index. """
+        piece = self.__class__.__new__(self.__class__)
+        piece._player = self._player
+        piece._row = self._row
+        piece._col = self._col
+        piece._square = self._square
+        piece._index = self._index
+        piece._side = self._side
+        piece._code = self._code
+        return piece
+
+    def set_index(self, index):
+        """ Set piece's position in its player's piece list. """
+        self._index = index
+
     def set_loc(self, loc):
-        """ Set piece location. """
+        """ Set piece location. Captured pieces are given the location (None, None). """
         self._row = loc[0]
         self._col = loc[1]
+        self._square = None if loc[0] is None else loc_to_square(loc)
+
+    def get_boundaries(self):
+        """ Return the set of mailbox squares the piece may stand on. """
+        return self._BOUNDARIES[self._side]
 
     def get_player(self):
         """ Get piece's player. """
         return self._player
 
-    def get_movements(self):
+    def get_movements(self, board, ranks, files):
         """ Get piece movements. """
         pass
 
@@ -393,315 +1638,173 @@ class Piece:
         """
         return 0 <= loc[0] <= 9 and 0 <= loc[1] <= 8
 
-    def get_adjacent(self):
-        """ Returns set of board locations adjacent to piece. """
-        adjacent = set()
-        idx_adjacent = [(0, -1), (0, 1), (-1, 0), (1, 0)]
-        for idx in idx_adjacent:
-            adjacent.add((self._row + idx[0], self._col + idx[1]))
-
-        return {move for move in adjacent if self.in_bounds(move) is True}
-
-    def get_diagonals(self):
-        """ Returns set of board locations diagonal to piece. """
-        diagonals = set()
-        idx_diagonals = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-        for idx in idx_diagonals:
-            diagonals.add((self._row + idx[0], self._col + idx[1]))
-
-        return {move for move in diagonals if self.in_bounds(move) is True}
-
 
 class General(Piece):
     """ Represents a General piece, inherits from Piece class. """
+    __slots__ = ()
+    _id = 'Ge'
+    _type = GENERAL
+    # General's boundaries are within the palace on each side
+    _BOUNDARIES = PALACE
+
     def __init__(self, player, row, col):
         """ Initializes data members. """
         super().__init__(player, row, col)
-        self._id = 'Ge'
-        # General's boundaries are within the palace on each side
-        if player == 'red':
-            self._boundaries = {(row,col) for row in range(0,3) for col in range(3,6)}
-        if player == 'black':
-            self._boundaries = {(row,col) for row in range(7,10) for col in range(3,6)}
 
-    def get_movements(self, board):
+    def get_movements(self, board, ranks, files):
         """
-        Returns a set of potential moves based on allowed general moves (1 square
+        Returns the potential moves based on allowed general moves (1 square
         orthogonally) and general boundaries (in palace).
         """
-        return self.get_adjacent() & self._boundaries
+        return GENERAL_MOVES[self._side][self._square]
 
 
 class Advisor(Piece):
     """ Represents an Advisor piece, inherits from Piece class. """
+    __slots__ = ()
+    _id = 'Ad'
+    _type = ADVISOR
+    # Advisor's boundaries are in palace, restricted to diagonals and center
+    _BOUNDARIES = ADVISOR_SQUARES
+
     def __init__(self, player, row, col):
         """ Initializes data members. """
         super().__init__(player, row, col)
-        self._id = 'Ad'
-        # Advisor's boundaries are in palace, restricted to diagonals and center
-        if player == 'red':
-            self._boundaries = {(0,3), (0,5), (1,4), (2,3), (2,5)}
-        if player == 'black':
-            self._boundaries = {(7,3), (7,5), (8,4), (9,3), (9,5)}
 
-    def get_movements(self, board):
+    def get_movements(self, board, ranks, files):
         """
-        Returns a set of potential moves based on allowed Advisor move (1 square
+        Returns the potential moves based on allowed Advisor move (1 square
         diagonal) and Advisor boundaries (in palace).
         """
-        return self.get_diagonals() & self._boundaries
+        return ADVISOR_MOVES[self._side][self._square]
 
 
 class Elephant(Piece):
     """ Represents an Elephant piece, inherits from Piece class. """
+    __slots__ = ()
+    _id = 'El'
+    _type = ELEPHANT
+    # Elephant boundaries are the 7 squares it can legally move to
+    _BOUNDARIES = ELEPHANT_SQUARES
+
     def __init__(self, player, row, col):
         """ Initializes data members. """
         super().__init__(player, row, col)
-        self._id = 'El'
-        # Elephant boundaries are the 7 squares it can legally move to
-        if player == 'red':
-            self._boundaries = {(0,2), (0,6), (2,0), (2,4), (2,8), (4,2), (4,6)}
-        if player == 'black':
-            self._boundaries = {(5,2), (5,6), (7,0), (7,4), (7,8), (9,2), (9,6)}
-
-    def get_movements(self, board):
-        """ Returns a set of potential moves for elephant. """
-        # get 1st diagonal away from elephant, if square is occupied, elephant cannot move
-        # in that direction
-        diagonals1 = {loc for loc in self.get_diagonals() if board[loc[0]][loc[1]] == ""}
-
-        # get positions 1 diagonal away from the 1st diagonal
-        diagonals2 = set()
-        idx_diagonals = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-        for loc in diagonals1:
-            for idx in idx_diagonals:
-                diagonals2.add((loc[0] + idx[0], loc[1] + idx[1]))
-
-        # Create set of locations based on elephant moving 2 points diagonally
-        movements = set()
-        idx_movements = [(2, 2), (2, -2), (-2, 2), (-2, -2)]
-        for idx in idx_movements:
-            movements.add((self._row + idx[0], self._col + idx[1]))
 
-        # Return intersection of diagonals, movements, and boundaries
-        return diagonals2 & movements & self._boundaries
+    def get_movements(self, board, ranks, files):
+        """ Returns a list of potential moves for elephant. """
+        # Elephant moves 2 points diagonally, if the 1st diagonal (the elephant's eye) is
+        # occupied, elephant cannot move in that direction
+        return [move for move, eye in ELEPHANT_MOVES[self._side][self._square] if board[eye] == EMPTY]
 
 
 class Horse(Piece):
     """ Represents a Horse piece, inherits from Piece class."""
+    __slots__ = ()
+    _id = 'Ho'
+    _type = HORSE
+
     def __init__(self, player, row, col):
         """ Initializes data members. """
         super().__init__(player, row, col)
-        self._id = 'Ho'
-
-    def get_movements(self, board):
-        """ Returns a set of potential moves for horse. """
-        # get 1st adjacent squares from Horse, if place is occupied, Horse cannot move in that
-        # direction
-        adjacent = {loc for loc in self.get_adjacent() if board[loc[0]][loc[1]] == ""}
-
-        # Get positions 1 diagonal from the adjacent position.
-        diagonal_from_adjacent = set()
-        idx_diagonals = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-        for loc in adjacent:
-            for idx in idx_diagonals:
-                diagonal_from_adjacent.add((loc[0] + idx[0], loc[1] + idx[1]))
 
-        # Create set of locations based on allowed horse movements
-        movements = set()
-        idx_horse = [(-1, -2), (-1, 2), (1, -2), (1, 2), (-2, -1), (-2, 1), (2, -1), (2, 1)]
-        for idx in idx_horse:
-            movements.add((self._row + idx[0], self._col + idx[1]))
-
-        # Return intersection of diagonal_from_adjacent, movements, and boundaries
-        return diagonal_from_adjacent & movements & self._boundaries
+    def get_movements(self, board, ranks, files):
+        """ Returns a list of potential moves for horse. """
+        # if the adjacent square the horse steps through (the horse's leg) is occupied,
+        # Horse cannot move in that direction
+        return [move for move, leg in HORSE_MOVES[self._square] if board[leg] == EMPTY]
 
 
 class Chariot(Piece):
     """ Represents a Chariot Piece, inherits from Piece class. """
+    __slots__ = ()
+    _id = 'Ch'
+    _type = CHARIOT
+
     def __init__(self, player, row, col):
         """ Initializes data members. """
         super().__init__(player, row, col)
-        self._id = 'Ch'
-
-    def get_movements(self, board):
-        """ Return a set of valid movements for Chariot. """
-        valid_moves = set()
-        idx = [-1, 1]
-        # Starting adjacent to player in each direction, check if each square is empty,
-        # if empty, add loc to valid moves, add to valid moves if occupied by opponent.
-        # Once any occupied square is found, stop searching in that direction.
-        for i in idx:
-            square_row = self._row + i
-            square_col = self._col
-            while 0 <= square_row <= 9:
-                if board[square_row][square_col] == "":
-                    valid_moves.add((square_row, square_col))
-                    square_row += i
-                else:
-
-                    if board[square_row][square_col].get_player() != self._player:
-                        valid_moves.add((square_row, square_col))
-                    break
-
-        for i in idx:
-            square_row = self._row
-            square_col = self._col + i
-            while 0 <= square_col <= 8:
-                if board[square_row][square_col] == "":
-                    valid_moves.add((square_row, square_col))
-                    square_col += i
-                else:
-                    if board[square_row][square_col].get_player() != self._player:
-                        valid_moves.add((square_row, square_col))
-                    break
 
-        return valid_moves
+    def get_movements(self, board, ranks, files):
+        """
+        Return a list of valid movements for Chariot: every empty square along its row
+        and column up to and including the first occupied square in each direction (it
+        is filtered out if it holds a piece of the same player). The squares are looked
+        up from the occupancy of the Chariot's row and column.
+        """
+        square = self._square
+        along_rank = RANK_SLIDES[self._col][ranks[self._row]][0]
+        along_file = FILE_SLIDES[self._row][files[self._col]][0]
+        return [square + offset for offset in along_rank + along_file]
 
 
 class Cannon(Piece):
     """ Represents a Cannon Piece, inherits from Piece class. """
+    __slots__ = ()
+    _id = 'Ca'
+    _type = CANNON
+
     def __init__(self, player, row, col):
         """ Initializes data members. """
         super().__init__(player, row, col)
-        self._id = 'Ca'
-
-    def get_movements(self, board):
-        """ Return a set of valid movements for Cannon piece. Starting adjacent to player
-        in each direction, check if each square is empty, if empty, add loc to valid moves.
-        If square is occupied, start checking on other side of occupied square, if an
-        opponent square is found, that square is a valid move, all other squares after
-        an occupied square are not valid moves."""
-
-        valid_moves = set()
-        idx = [-1, 1]
-        # Column stays the same, check up and down
-        for i in idx:
-            square_row = self._row + i
-            square_col = self._col
-            # starting adjacent to player in the same column, if loc empty, add to valid moves
-            while 0 <= square_row <= 9:
-                if board[square_row][square_col] == "":
-                    valid_moves.add((square_row, square_col))
-                    square_row += i
-                else:
-                    # if loc occupied, skip over and keep checking until end of column
-                    square_row += i
-                    while 0 <= square_row <= 9:
-                        # if empty, it is not a valid move (piece already jumped 1 piece)
-                        if board[square_row][square_col] == "":
-                            square_row += i
-                        else:
-                            # valid move if a square is occupied by opponent
-                            if board[square_row][square_col].get_player() != self._player:
-                                valid_moves.add((square_row, square_col))
-                            break
-                    break
-        # row stays the same, check left and right
-        for i in idx:
-            square_row = self._row
-            square_col = self._col + i
-            # starting adjacent to player in the same row, if loc empty, add to valid moves
-            while 0 <= square_col <= 8:
-                if board[square_row][square_col] == "":
-                    valid_moves.add((square_row, square_col))
-                    square_col += i
-                else:
-                    # if loc occupied, skip over and keep checking until end of row
-                    square_col += i
-                    while 0 <= square_col <= 8:
-                        # if empty, it is not a valid move (piece already jumped 1 piece)
-                        if board[square_row][square_col] == "":
-                            square_col += i
-                        else:
-                            # valid move if a square is occupied by opponent
-                            if board[square_row][square_col].get_player() != self._player:
-                                valid_moves.add((square_row, square_col))
-                            break
-                    break
 
-        return valid_moves
+    def get_movements(self, board, ranks, files):
+        """ Return a list of valid movements for Cannon piece. Starting adjacent to player
+        in each direction, every empty square is a valid move. Once a square is occupied,
+        the Cannon may jump over it to the next occupied square, which is a valid move if
+        it holds an opponent (filtered out otherwise). The squares are looked up from the
+        occupancy of the Cannon's row and column."""
+        square = self._square
+        along_rank = RANK_SLIDES[self._col][ranks[self._row]][1]
+        along_file = FILE_SLIDES[self._row][files[self._col]][1]
+        return [square + offset for offset in along_rank + along_file]
 
 class Soldier(Piece):
     """ Represents a Soldier Piece, inherits from Piece class. """
+    __slots__ = ()
+    _id = 'So'
+    _type = SOLDIER
+
     def __init__(self, player, row, col):
         """ Initializes data members. """
         super().__init__(player, row, col)
-        self._id = "So"
 
-    def get_movements(self, board):
+    def get_movements(self, board, ranks, files):
         """
-        Creates a set of potential movements based on allowed moves (forward 1 square
-        until they cross the river, then forward 1 square or orthogonal 1 square.
-        Returns a set of potential movements based on movement set and board boundaries.
+        Returns the potential movements based on allowed moves (forward 1 square
+        until they cross the river, then forward 1 square or orthogonal 1 square) and
+        board boundaries.
         """
-        movements = set()
-        if self._player == 'red':
-            if self._row >= 5:
-                movements = {
-                    (self._row, self._col - 1),             # left
-                    (self._row, self._col + 1),             # right
-                    (self._row + 1, self._col)              # up
-                }
-            else:
-                movements = {(self._row + 1, self._col)}    # up
-
-        if self._player == 'black':
-            if self._row <= 4:
-                movements = {
-                    (self._row, self._col - 1),             # left
-                    (self._row, self._col + 1),             # right
-                    (self._row - 1, self._col)              # down
-                }
-            else:
-                movements = {(self._row - 1, self._col)}    # down
-
-        return movements & self._boundaries
-
-# TESTING CODE
-game = XiangqiGame()
-game.make_move('c1', 'e3')
-game.make_move('e7', 'e6')
-game.make_move('b1', 'd2')
-game.make_move('h10', 'g8')
-game.make_move('h1', 'i3')
-game.make_move('g10', 'e8')
-game.make_move('h3', 'g3')
-game.make_move('i7', 'i6')
-game.make_move('i1', 'h1')
-game.make_move('g7', 'g6')
-game.make_move('d2', 'f3')
-game.make_move('h8', 'i8')
-game.make_move('d1', 'e2')
-game.make_move('b8', 'd8')
-game.make_move('a1', 'd1')
-game.make_move('b10', 'c8')
-game.make_move('g4', 'g5')
-game.make_move('d10', 'e9')
-game.make_move('g5', 'g6')
-game.make_move('g8', 'f6')
-game.make_move('g3', 'g2')
-game.make_move('f6', 'e4')
-game.make_move('d1', 'd4')
-game.make_move('a10', 'b10')
-game.make_move('d4', 'e4')
-game.make_move('i8', 'i4')
-game.make_move('e1', 'd1')
-game.make_move('b10', 'b3')
-game.make_move('f3', 'e5')
-game.make_move('i10', 'i7')
-game.make_move('h1', 'h10')
-game.make_move('e6', 'e5')
-game.make_move('h10', 'f10')
-game.make_move('e10', 'f10')
-game.make_move('e4', 'i4')
-game.make_move('d1', 'e1')
-game.make_move('i7', 'd7')
-game.make_move('c4', 'c5')
-game.make_move('b3', 'b1')
-game.make_move('e2', 'd1')
-game.make_move('b1', 'd1')
-game.make_move('e1', 'e2')
-game.make_move('d7', 'd2')
-game.make_move('i4', 'd4')
-game.make_move('d7', 'd4')
+        return SOLDIER_MOVES[self._side][self._square]
+
+
+# Piece class for each piece type code
+PIECE_CLASSES = {
+    GENERAL: General,
+    ADVISOR: Advisor,
+    ELEPHANT: Elephant,
+    HORSE: Horse,
+    CHARIOT: Chariot,
+    CANNON: Cannon,
+    SOLDIER: Soldier,
+}
+
+def board_printer(game, from_loc_alg, to_loc_alg):
+    """
+    Move observer that prints the board once black has moved, as games used to do on
+    every move. Add it to a game with add_observer for console play.
+    """
+    if game.get_player_turn() == 'red':
+        game.print_board()
+
+
+def main():
+    """ Plays a demonstration game, printing the board after each of black's moves. """
+    game = XiangqiGame()
+    game.add_observer(board_printer)
+    for from_str, to_str in DEMO_GAME:
+        game.make_move(from_str, to_str)
+
+
+if __name__ == "__main__":
+    main()
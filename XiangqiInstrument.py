@@ -0,0 +1,241 @@
+# Description: Opt-in instrumentation of the move validation hot path of a XiangqiGame. The
+#              game methods to watch are wrapped on one game instance, so games that are not
+#              instrumented run the class methods untouched and pay nothing. Each wrapped
+#              method gets a call count and a cumulative wall time; each make_move call gets
+#              a record of the position it was played in, its time, the nodes (positions made
+#              with push_move) it visited and the calls it made, so slow moves can be traced
+#              back to the positions that caused them. Results are exported as a dict or JSON
+#              snapshot, and make_move calls can optionally be run under cProfile.
+
+import argparse
+import cProfile
+import heapq
+import io
+import json
+import pstats
+import sys
+import time
+
+from XiangqiGame import XiangqiGame, START_FEN, DEMO_GAME
+from XiangqiDatabase import split_move, game_from_command_line
+
+# Moves played by the command line tool by default
+DEFAULT_MOVES = DEMO_GAME
+
+# Game methods instrumented by default. Timings are inclusive: make_move includes the
+# is_legal_move and check_player_moves it calls, test_move includes push_move, and so on.
+DEFAULT_METHODS = ('make_move', 'is_legal_move', 'get_valid_moves', 'get_piece_moves', 'test_move', 'push_move',
+                   'is_in_check', 'is_general_attacked', 'check_player_moves')
+
+# make_move records kept by default (the slowest ones)
+DEFAULT_KEEP = 10
+
+
+class Instrumentation:
+    """
+    Counts and times calls to the game methods listed in methods by wrapping them on one
+    game instance (with add_method_wrapper), until remove is called (or the end of a with
+    statement). If make_move is among them, each make_move call is recorded as a dict:
+        ply       moves on the move stack before the move
+        fen       the position the move was played in
+        move      the move, e.g. 'c1e3'
+        legal     False if make_move refused the move
+        seconds   wall time of the call
+        nodes     positions made with push_move during the call (if push_move is watched)
+        calls     calls of each other watched method made during the call
+    The keep slowest records are kept for snapshot, and hook (if given) is called with
+    every record as it is made. If profile is True, make_move calls run under cProfile.
+    """
+    def __init__(self, game, methods=DEFAULT_METHODS, keep=DEFAULT_KEEP, hook=None, profile=False):
+        """ Initializes data members and wraps the game's methods. """
+        self._game = game
+        self._methods = tuple(methods)
+        self._keep = keep
+        self._hook = hook
+        self._profile = cProfile.Profile() if profile else None
+        self._calls = {}
+        self._seconds = {}
+        # make_move totals, and the slowest records as a heap of (seconds, sequence, record)
+        self._move_count = 0
+        self._move_nodes = 0
+        self._max_nodes = 0
+        self._slowest = []
+        self.reset()
+        for name in self._methods:
+            if name == 'make_move':
+                wrapper = self.wrap_move(getattr(game, name))
+            else:
+                wrapper = self.wrap(name, getattr(game, name))
+            game.add_method_wrapper(name, wrapper)
+
+    def __enter__(self):
+        """ Returns the instrumentation for use in a with statement. """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """ Removes the wrappers at the end of a with statement. """
+        self.remove()
+
+    def wrap(self, name, method):
+        """ Returns a function that calls method and adds its call count and time. """
+        calls = self._calls
+        seconds = self._seconds
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                seconds[name] += perf_counter() - start
+                calls[name] += 1
+        return timed
+
+    def wrap_move(self, method):
+        """
+        Returns a function that calls make_move (method), under cProfile if profiling, adds
+        its call count and time and records the move.
+        """
+        game = self._game
+        calls = self._calls
+        seconds = self._seconds
+        perf_counter = time.perf_counter
+
+        def timed_move(from_loc_alg, to_loc_alg, *args, **kwargs):
+            ply = len(game.get_move_history())
+            fen = game.to_fen()
+            before = dict(calls)
+            profile = self._profile
+            start = perf_counter()
+            if profile is not None:
+                profile.enable()
+            try:
+                result = method(from_loc_alg, to_loc_alg, *args, **kwargs)
+            finally:
+                if profile is not None:
+                    profile.disable()
+                elapsed = perf_counter() - start
+                seconds['make_move'] += elapsed
+                calls['make_move'] += 1
+            self.record_move(ply, fen, str(from_loc_alg) + str(to_loc_alg), result is not False, elapsed, before)
+            return result
+        return timed_move
+
+    def record_move(self, ply, fen, move, legal, seconds, before):
+        """
+        Records a make_move call, given the call counts from before it, in the totals and
+        (if it is one of the slowest) the kept records, and passes it to the hook.
+        """
+        calls = {name: count - before[name] for name, count in self._calls.items()
+                 if name != 'make_move' and count != before[name]}
+        nodes = calls.get('push_move', 0)
+        record = {'ply': ply, 'fen': fen, 'move': move, 'legal': legal, 'seconds': seconds, 'nodes': nodes,
+                  'calls': calls}
+        self._move_count += 1
+        self._move_nodes += nodes
+        self._max_nodes = max(self._max_nodes, nodes)
+        if self._keep:
+            entry = (seconds, self._move_count, record)
+            if len(self._slowest) < self._keep:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heappushpop(self._slowest, entry)
+        if self._hook is not None:
+            self._hook(record)
+
+    def remove(self):
+        """ Removes the wrappers, restoring the game's own methods. """
+        for name in self._methods:
+            self._game.remove_method_wrapper(name)
+
+    def reset(self):
+        """ Clears the counts, times, records and profile gathered so far. """
+        for name in self._methods:
+            self._calls[name] = 0
+            self._seconds[name] = 0.0
+        self._move_count = 0
+        self._move_nodes = 0
+        self._max_nodes = 0
+        self._slowest = []
+        if self._profile is not None:
+            self._profile = cProfile.Profile()
+
+    def get_methods(self):
+        """ Returns a dict of method name to (call count, cumulative seconds). """
+        return {name: (self._calls[name], self._seconds[name]) for name in self._methods}
+
+    def get_slowest(self):
+        """ Returns the kept make_move records, slowest first. """
+        return [record for seconds, sequence, record in sorted(self._slowest, reverse=True)]
+
+    def get_profile_stats(self):
+        """ Returns a pstats.Stats of the profiled make_move calls, or None if not profiling. """
+        if self._profile is None:
+            return None
+        return pstats.Stats(self._profile, stream=io.StringIO())
+
+    def snapshot(self):
+        """
+        Returns a dict of plain values (suitable for JSON): 'methods', the call count and
+        seconds of each watched method; 'moves', the make_move totals (count, seconds,
+        nodes, nodes per move and the most nodes of one move); and 'slowest', the kept
+        make_move records, slowest first.
+        """
+        count = self._move_count
+        return {
+            'methods': {name: {'calls': self._calls[name], 'seconds': self._seconds[name]} for name in self._methods},
+            'moves': {'count': count, 'seconds': self._seconds.get('make_move', 0.0), 'nodes': self._move_nodes,
+                      'nodes_per_move': self._move_nodes / count if count else 0.0, 'max_nodes': self._max_nodes},
+            'slowest': self.get_slowest(),
+        }
+
+    def to_json(self, indent=None):
+        """ Returns the snapshot as a JSON string. """
+        return json.dumps(self.snapshot(), indent=indent)
+
+
+def main(argv=None):
+    """ Command line entry point. Returns the process exit status. """
+    parser = argparse.ArgumentParser(description="Instrument make_move over a sequence of Xiangqi moves.")
+    parser.add_argument("moves", nargs="*",
+                        help="moves to play from the --fen position, e.g. c1e3 e7e6 (default: the demonstration game)")
+    parser.add_argument("--fen", default=START_FEN, help="position to start from, in Xiangqi FEN")
+    parser.add_argument("-k", "--keep", type=int, default=DEFAULT_KEEP,
+                        help="slowest moves to report (default %d)" % DEFAULT_KEEP)
+    parser.add_argument("--json", action="store_true", help="print the snapshot as JSON")
+    parser.add_argument("--profile", type=int, metavar="LINES",
+                        help="profile make_move with cProfile and print the top LINES functions")
+    args = parser.parse_args(argv)
+
+    # check the position and moves on a game of their own before timing them
+    game_from_command_line(parser, args.fen, args.moves)
+    moves = [split_move(move) for move in args.moves] or DEFAULT_MOVES
+    game = XiangqiGame.from_fen(args.fen)
+    with Instrumentation(game, keep=args.keep, profile=args.profile is not None) as instrumentation:
+        for from_str, to_str in moves:
+            game.make_move(from_str, to_str)
+
+    if args.json:
+        print(instrumentation.to_json(indent=2))
+        return 0
+    snapshot = instrumentation.snapshot()
+    for name, method in snapshot['methods'].items():
+        print("%-20s calls %9d  time %9.3f ms" % (name, method['calls'], 1000 * method['seconds']))
+    moves = snapshot['moves']
+    print("moves %d  %.1f us per move  nodes %d  %.1f per move  max %d" % (
+        moves['count'], 1e6 * moves['seconds'] / max(moves['count'], 1), moves['nodes'], moves['nodes_per_move'],
+        moves['max_nodes']))
+    print("slowest moves:")
+    for record in snapshot['slowest']:
+        print("  ply %3d  %-6s %8.1f us  nodes %4d  %s%s" % (
+            record['ply'], record['move'], 1e6 * record['seconds'], record['nodes'], record['fen'],
+            "" if record['legal'] else "  (illegal)"))
+    if args.profile is not None:
+        stats = instrumentation.get_profile_stats()
+        stats.stream = sys.stdout
+        stats.sort_stats('cumulative').print_stats(args.profile)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
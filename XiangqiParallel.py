@@ -0,0 +1,176 @@
+# Description: Multi-core search for XiangqiGame using Lazy SMP: every worker process of a
+#              process pool searches the same position with iterative deepening, sharing one
+#              transposition table placed in shared memory, so each worker benefits from the
+#              positions the others have already searched. Positions travel to the workers as
+#              the 91-byte packed form from XiangqiGame.pack_position.
+
+import argparse
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+
+from XiangqiGame import XiangqiGame, START_FEN
+from XiangqiEngine import XiangqiEngine, SearchResult, MAX_PLY
+from XiangqiTransposition import TranspositionTable, buffer_size
+from XiangqiDatabase import game_from_command_line
+
+# Per-process state of a worker, set up by init_worker
+worker_memory = None
+worker_tt = None
+worker_stop = None
+
+
+def init_worker(memory_name, stop_event):
+    """
+    Process pool initializer: attaches the worker to the shared transposition table and
+    the event used to stop all workers once one has finished.
+    """
+    global worker_memory, worker_tt, worker_stop
+    # the parent process owns the shared memory block and unlinks it, workers only attach.
+    # Workers share the parent's resource tracker, so attaching registers nothing new; on
+    # Python versions that allow it they skip the tracker altogether.
+    if sys.version_info >= (3, 13):
+        worker_memory = shared_memory.SharedMemory(name=memory_name, track=False)
+    else:
+        worker_memory = shared_memory.SharedMemory(name=memory_name)
+    worker_tt = TranspositionTable(buffer=worker_memory.buf)
+    worker_stop = stop_event
+
+
+def worker_search(packed, worker_id, generation, time_ms, max_nodes, max_depth):
+    """
+    Searches a packed position in a worker process and returns the worker's SearchResult.
+    Workers with an odd id start one ply deeper, so the workers spread over different
+    depths and fill the shared table with different results.
+    """
+    game = XiangqiGame.unpack_position(packed)
+    worker_tt.set_generation(generation)
+    worker_tt.reset_stats()
+    engine = XiangqiEngine(game, tt=worker_tt, stop=worker_stop.is_set)
+    start_depth = min(1 + worker_id % 2, max_depth)
+    return engine.best_move(time_ms, max_nodes, max_depth, start_depth=start_depth, new_search=False)
+
+
+class ParallelSearch:
+    """
+    Lazy SMP search over a pool of worker processes sharing a transposition table of
+    hash_mb megabytes in shared memory. Call close() (or use as a context manager) to shut
+    the pool down and free the shared memory.
+    """
+    def __init__(self, workers=None, hash_mb=64):
+        """ Initializes data members, creates the shared table and starts the worker pool. """
+        self._workers = workers or multiprocessing.cpu_count()
+        self._memory = shared_memory.SharedMemory(create=True, size=buffer_size(hash_mb))
+        # shared memory may hold old data on some platforms, the table must start empty
+        self._memory.buf[:] = bytes(self._memory.size)
+        self._tt = TranspositionTable(buffer=self._memory.buf)
+        self._stop = multiprocessing.Event()
+        self._pool = ProcessPoolExecutor(max_workers=self._workers, initializer=init_worker,
+                                         initargs=(self._memory.name, self._stop))
+
+    def __enter__(self):
+        """ Returns the search object for use in a with statement. """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """ Closes the search at the end of a with statement. """
+        self.close()
+
+    def get_workers(self):
+        """ Returns the number of worker processes. """
+        return self._workers
+
+    def close(self):
+        """ Shuts down the worker pool and frees the shared memory. """
+        self._pool.shutdown()
+        self._tt = None
+        self._memory.close()
+        self._memory.unlink()
+
+    def best_move(self, game, time_ms=None, max_nodes=None, max_depth=MAX_PLY):
+        """
+        Searches the game's current position on all workers and returns a SearchResult:
+        the deepest completed result of any worker (the first to finish among equals),
+        with the node count summed over all workers and the wall-clock time of the search.
+        The node budget applies to each worker. The position's move history is not sent,
+        so repetitions of positions before the search are not detected.
+        """
+        packed = game.pack_position()
+        self._tt.new_search()
+        self._stop.clear()
+        start = time.perf_counter()
+        futures = [self._pool.submit(worker_search, packed, worker_id, self._tt.get_generation(), time_ms,
+                                     max_nodes, max_depth)
+                   for worker_id in range(self._workers)]
+
+        # once any worker completes its search, the others stop at their next check
+        done, pending = wait(futures, return_when=FIRST_COMPLETED)
+        self._stop.set()
+        finished = [future.result() for future in done]
+        wait(pending)
+        results = finished + [future.result() for future in pending]
+        seconds = time.perf_counter() - start
+
+        best = results[0]
+        for result in results[1:]:
+            if result.get_depth() > best.get_depth() and result.get_best_move() is not None:
+                best = result
+        nodes = sum(result.get_nodes() for result in results)
+        return SearchResult(best.get_best_move(), best.get_pv(), best.get_score(), best.get_depth(), nodes,
+                            seconds)
+
+    def clear(self):
+        """ Empties the shared transposition table. """
+        self._tt.clear()
+
+
+def benchmark(game, depth, worker_counts, hash_mb=64, repeat=1):
+    """
+    Measures time to reach a fixed depth on the game's position for each worker count and
+    prints time, nodes, nodes per second and the speedup over the first worker count.
+    Returns a list of (workers, seconds) pairs.
+    """
+    timings = []
+    for workers in worker_counts:
+        with ParallelSearch(workers, hash_mb) as search:
+            # warm up the pool so process start-up is not timed
+            search.best_move(game, max_depth=1)
+            seconds = 0.0
+            for run in range(repeat):
+                search.clear()
+                result = search.best_move(game, max_depth=depth)
+                seconds += result.get_seconds()
+            seconds /= repeat
+        timings.append((workers, seconds))
+        print("workers %3d  time %8.3fs  nodes %10d  nps %10.0f  speedup %5.2fx  best %s" % (
+            workers, seconds, result.get_nodes(), result.get_nps(), timings[0][1] / seconds,
+            result.get_best_move()))
+    return timings
+
+
+def main(argv=None):
+    """ Command line entry point: time-to-depth speedup of the parallel search by worker count. """
+    parser = argparse.ArgumentParser(description="Benchmark the parallel Xiangqi search.")
+    parser.add_argument("moves", nargs="*", help="moves to play from the --fen position, e.g. c1e3 e7e6")
+    parser.add_argument("--fen", default=START_FEN, help="position to start from, in Xiangqi FEN")
+    parser.add_argument("-d", "--depth", type=int, default=5, help="search depth (default 5)")
+    parser.add_argument("-w", "--workers", type=int, nargs="+",
+                        help="worker counts to compare (default 1, 2, 4, ... up to the CPU count)")
+    parser.add_argument("--hash", type=int, default=64, help="shared table size in megabytes")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="runs to average per worker count")
+    args = parser.parse_args(argv)
+
+    game = game_from_command_line(parser, args.fen, args.moves)
+
+    worker_counts = args.workers
+    if worker_counts is None:
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= multiprocessing.cpu_count():
+            worker_counts.append(worker_counts[-1] * 2)
+    benchmark(game, args.depth, worker_counts, args.hash, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
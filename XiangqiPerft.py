@@ -0,0 +1,205 @@
+# Description: Perft (performance test) tool and benchmark suite for XiangqiGame. Counts the
+#              leaves of the legal move tree to a given depth from the start position and
+#              from stored middlegame/endgame positions, checks the counts against known
+#              reference values, and reports nodes per second and per-phase timings. With
+#              --verify, the game's incrementally kept attack maps are checked against attack
+#              maps worked out from scratch after every move made and unmade.
+
+import argparse
+import sys
+import time
+
+from XiangqiGame import XiangqiGame, START_FEN, BOARD_SQUARES, BOARD_SIZE, RED, BLACK, square_to_loc
+from XiangqiInstrument import Instrumentation
+
+
+# Stored positions in Xiangqi FEN, with the reference perft node counts for depths 1, 2,
+# 3, ... The middlegame and endgame positions come from games played from the start.
+POSITIONS = {
+    'start': {
+        'fen': START_FEN,
+        'nodes': [44, 1920, 79666, 3290240],
+    },
+    'middlegame': {
+        'fen': 'r1b1ka2r/4a4/2ncb3c/p1p6/4pnP1p/9/P1P1P3P/1C2BNC1N/4A4/3RKABR1 w - - 1 11',
+        'nodes': [51, 1824, 91950],
+    },
+    'endgame': {
+        'fen': '2c6/5k2r/8n/3P4p/2b6/9/P8/2NK3R1/9/6B2 b - - 0 49',
+        'nodes': [22, 543, 11613],
+    },
+}
+
+# Game methods timed when phase timings are requested (timings are inclusive: test_move
+# includes the is_general_attacked it calls)
+PHASES = ['get_piece_moves', 'test_move', 'is_general_attacked']
+
+
+def load_position(name):
+    """ Returns a new XiangqiGame set up in the stored position. """
+    return XiangqiGame.from_fen(POSITIONS[name]['fen'])
+
+
+def legal_moves(game):
+    """ Returns a list of (from_loc, to_loc) tuples of legal moves for the player to move. """
+    return list(game.iter_legal_moves(algebraic=False))
+
+
+def perft(game, depth):
+    """
+    Returns the number of leaves of the legal move tree of depth plies below the game's
+    current position. Moves are made and unmade on the game itself, which is left as it
+    was found.
+    """
+    if depth == 0:
+        return 1
+    moves = legal_moves(game)
+    # the leaves one ply down are just the legal moves, no need to make them
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for from_loc, to_loc in moves:
+        game.push_move(from_loc, to_loc)
+        nodes += perft(game, depth - 1)
+        game.pop_move()
+    return nodes
+
+
+def find_attack_mismatch(game):
+    """
+    Compares the game's attack maps (attack_count, refreshed lazily from the squares
+    changed since the last refresh) with counts summed from piece_attacks over every
+    piece on the board. Returns None if they agree, otherwise a description of the
+    first square where they differ.
+    """
+    counts = {RED: [0] * BOARD_SIZE, BLACK: [0] * BOARD_SIZE}
+    for player in ('red', 'black'):
+        for piece in game.get_pieces(player):
+            side_counts = counts[piece.get_side()]
+            for target in game.piece_attacks(piece.get_square(), piece.get_code()):
+                side_counts[target] += 1
+    for side, name in ((RED, 'red'), (BLACK, 'black')):
+        for square in BOARD_SQUARES:
+            if game.attack_count(square, side) != counts[side][square]:
+                return "%s attacks on %s: attack map %d, from scratch %d" % (
+                    name, game.tuple_to_str(square_to_loc(square)), game.attack_count(square, side),
+                    counts[side][square])
+    return None
+
+
+def check_attacks(game, path, action):
+    """
+    Raises RuntimeError if find_attack_mismatch finds a mismatch once the last of the
+    moves in path has been made or unmade (action).
+    """
+    mismatch = find_attack_mismatch(game)
+    if mismatch is not None:
+        raise RuntimeError("moves %s, last one %s, position %s: %s" % (' '.join(path), action, game.to_fen(),
+                                                                       mismatch))
+
+
+def verified_perft(game, depth, path=()):
+    """
+    Perft that makes every move, down to the last ply, and checks the attack maps with
+    find_attack_mismatch after each move is made and after it is unmade. Returns the
+    number of leaves. Raises RuntimeError naming the position and the moves leading to it
+    on the first mismatch.
+    """
+    if depth == 0:
+        return 1
+    nodes = 0
+    for from_loc, to_loc in legal_moves(game):
+        move = game.tuple_to_str(from_loc) + game.tuple_to_str(to_loc)
+        game.push_move(from_loc, to_loc)
+        check_attacks(game, path + (move,), "made")
+        nodes += verified_perft(game, depth - 1, path + (move,))
+        game.pop_move()
+        check_attacks(game, path + (move,), "unmade")
+    return nodes
+
+
+def divide(game, depth):
+    """ Returns a dict of the perft count below each legal move of the current position. """
+    counts = {}
+    for from_loc, to_loc in legal_moves(game):
+        game.push_move(from_loc, to_loc)
+        counts[(from_loc, to_loc)] = perft(game, depth - 1)
+        game.pop_move()
+    return counts
+
+
+def run_position(name, depth, phases=False, verify=False, out=sys.stdout):
+    """
+    Runs perft to each depth from 1 to depth on a stored position, printing nodes, time
+    and nodes per second for each depth, and phase timings if phases is True. If verify
+    is True, verified_perft is run instead, checking the attack maps at every move (and
+    raising RuntimeError on a mismatch). Returns False if a node count does not match the
+    reference value, otherwise returns True.
+    """
+    game = load_position(name)
+    reference = POSITIONS[name]['nodes']
+    passed = True
+    print(name, file=out)
+    for current in range(1, depth + 1):
+        timer = Instrumentation(game, PHASES) if phases else None
+        start = time.perf_counter()
+        nodes = verified_perft(game, current) if verify else perft(game, current)
+        seconds = time.perf_counter() - start
+        if timer is not None:
+            timer.remove()
+
+        if current <= len(reference):
+            expected = reference[current - 1]
+            status = "ok" if nodes == expected else "MISMATCH (expected " + str(expected) + ")"
+            passed = passed and nodes == expected
+        else:
+            status = "no reference"
+        if verify:
+            status += ", attack maps verified"
+        nps = nodes / seconds if seconds > 0 else 0.0
+        print("  depth %d  nodes %10d  time %8.3fs  nps %10.0f  %s" % (current, nodes, seconds, nps, status),
+              file=out)
+        if timer is not None:
+            for phase, (calls, phase_seconds) in timer.get_methods().items():
+                print("      %-20s calls %10d  time %8.3fs" % (phase, calls, phase_seconds), file=out)
+    return passed
+
+
+def main(argv=None):
+    """ Command line entry point. Returns the process exit status. """
+    parser = argparse.ArgumentParser(description="Perft benchmark suite for XiangqiGame.")
+    parser.add_argument("-d", "--depth", type=int, default=3, help="maximum depth (default 3)")
+    parser.add_argument("-p", "--position", action="append", choices=sorted(POSITIONS),
+                        help="stored position to run (default: all)")
+    parser.add_argument("--phases", action="store_true",
+                        help="report per-phase timings (adds timing overhead)")
+    parser.add_argument("--verify", action="store_true",
+                        help="check the incremental attack maps against a from-scratch computation after every "
+                             "move made and unmade (slow)")
+    parser.add_argument("--divide", action="store_true",
+                        help="print the node count below each root move instead")
+    args = parser.parse_args(argv)
+
+    names = args.position or list(POSITIONS)
+    if args.divide:
+        for name in names:
+            game = load_position(name)
+            counts = divide(game, args.depth)
+            print(name)
+            for (from_loc, to_loc), nodes in sorted(counts.items()):
+                print("  %s%s %d" % (game.tuple_to_str(from_loc), game.tuple_to_str(to_loc), nodes))
+            print("  total", sum(counts.values()))
+        return 0
+
+    passed = True
+    for name in names:
+        try:
+            passed = run_position(name, args.depth, args.phases, args.verify) and passed
+        except RuntimeError as error:
+            print("  attack map mismatch " + str(error))
+            passed = False
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
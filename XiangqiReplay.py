@@ -0,0 +1,165 @@
+# Description: Bulk replay and validation of Xiangqi game records across a process pool.
+#              Games (move lists) are read lazily from any iterable or file, sent to worker
+#              processes in chunks with a bounded number of chunks in flight, and the result
+#              of each game comes back, in input order, from a generator, so memory use stays
+#              flat however large the input is.
+
+import argparse
+import itertools
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from XiangqiGame import XiangqiGame
+from XiangqiDatabase import split_move
+
+
+class ReplayResult:
+    """
+    Result of replaying one game record: its index in the input, the game state after the
+    last legal move, the number of legal moves made, the index of the first illegal move
+    (None if every move was legal) and the plies after which the player to move was in
+    check.
+    """
+    def __init__(self, index, game_state, plies, first_illegal, checks):
+        """ Initializes data members. """
+        self._index = index
+        self._game_state = game_state
+        self._plies = plies
+        self._first_illegal = first_illegal
+        self._checks = checks
+
+    def __repr__(self):
+        """ Display the result's fields when printing result objects. """
+        return "ReplayResult(index=%d, game_state=%s, plies=%d, first_illegal=%s, checks=%s)" % (
+            self._index, self._game_state, self._plies, self._first_illegal, self._checks)
+
+    def get_index(self):
+        """ Returns the index of the game in the input. """
+        return self._index
+
+    def get_game_state(self):
+        """ Returns the game state after the last legal move. """
+        return self._game_state
+
+    def get_plies(self):
+        """ Returns the number of legal moves made. """
+        return self._plies
+
+    def get_first_illegal(self):
+        """ Returns the index of the first illegal move, or None if all moves were legal. """
+        return self._first_illegal
+
+    def is_valid(self):
+        """ Returns True if every move of the game was legal, otherwise returns False. """
+        return self._first_illegal is None
+
+    def get_checks(self):
+        """ Returns the list of plies (1 for the first move) that gave check. """
+        return self._checks
+
+
+def replay_game(index, record):
+    """
+    Replays a game record from the start position with make_move, stopping at the first
+    illegal or malformed move (including any move after the game has ended), and returns
+    its ReplayResult. A record is a string of moves such as 'c1e3 e7e6', or a sequence of
+    such moves or of (from, to) pairs.
+    """
+    if isinstance(record, str):
+        record = record.split()
+    game = XiangqiGame()
+    checks = []
+    first_illegal = None
+    for ply, move in enumerate(record):
+        try:
+            from_str, to_str = split_move(move) if isinstance(move, str) else move
+            legal = game.make_move(from_str, to_str) is not False
+        except (ValueError, IndexError):
+            legal = False
+        if not legal:
+            first_illegal = ply
+            break
+        if game.is_general_attacked(game.get_player_turn()):
+            checks.append(ply + 1)
+    plies = len(record) if first_illegal is None else first_illegal
+    return ReplayResult(index, game.get_game_state(), plies, first_illegal, checks)
+
+
+def replay_chunk(start, records):
+    """ Replays a list of game records numbered from start and returns their results. """
+    return [replay_game(start + offset, record) for offset, record in enumerate(records)]
+
+
+def iter_chunks(records, chunk_size):
+    """ Generator of lists of up to chunk_size consecutive records of an iterable. """
+    iterator = iter(records)
+    chunk = list(itertools.islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, chunk_size))
+
+
+def replay_games(records, workers=None, chunk_size=64, prefetch=2):
+    """
+    Generator of the ReplayResult of each game record of an iterable, in input order.
+    Records are read lazily and replayed in chunks of chunk_size games on a pool of
+    workers processes (the CPU count if None), with at most workers * prefetch chunks
+    submitted and not yet consumed. If workers is 0, games are replayed in this process.
+    """
+    chunks = enumerate(iter_chunks(records, chunk_size))
+    if workers == 0:
+        for number, chunk in chunks:
+            yield from replay_chunk(number * chunk_size, chunk)
+        return
+
+    workers = workers or os.cpu_count()
+    pool = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for number, chunk in chunks:
+            pending.append(pool.submit(replay_chunk, number * chunk_size, chunk))
+            if len(pending) >= workers * prefetch:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # the consumer may stop early, drop the chunks not yet started
+        pool.shutdown(cancel_futures=True)
+
+
+def main(argv=None):
+    """
+    Command line entry point: replays a file of games, one per line, and prints the
+    results of invalid games (or of all games with --all) and the throughput. Returns
+    the process exit status.
+    """
+    parser = argparse.ArgumentParser(description="Replay and validate Xiangqi game records.")
+    parser.add_argument("games", help="text file of games, moves such as c1e3 separated by spaces ('-' for stdin)")
+    parser.add_argument("-w", "--workers", type=int, help="worker processes (default: CPU count, 0 for none)")
+    parser.add_argument("-c", "--chunk-size", type=int, default=64, help="games per task (default 64)")
+    parser.add_argument("--all", action="store_true", help="print the result of every game")
+    args = parser.parse_args(argv)
+
+    games = sys.stdin if args.games == '-' else open(args.games)
+    counts = {}
+    invalid = 0
+    start = time.perf_counter()
+    with games:
+        for result in replay_games((line for line in games if line.strip()), args.workers, args.chunk_size):
+            counts[result.get_game_state()] = counts.get(result.get_game_state(), 0) + 1
+            if not result.is_valid():
+                invalid += 1
+            if args.all or not result.is_valid():
+                print(result)
+    seconds = time.perf_counter() - start
+    total = sum(counts.values())
+    print("%d games (%d invalid) in %.2fs, %.0f games/sec, states %s" % (
+        total, invalid, seconds, total / seconds if seconds > 0 else 0.0, counts), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
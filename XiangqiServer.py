@@ -0,0 +1,306 @@
+# Description: Asyncio session server hosting many XiangqiGame instances in one process, over a
+#              local TCP or Unix socket line protocol, and a load generator that plays games
+#              against it and reports move latency. One event loop serves every connection;
+#              requests on the same game are serialized by a per-game lock. Every request,
+#              including the checkmate scan after a checking move, runs on the event loop: the
+#              scan stops at the first legal reply and costs tens of microseconds, less than
+#              handing the position to a thread or process pool would.
+#
+#              Protocol: one request per line, answered by one line, 'OK ...' or 'ERR message'
+#                NEW [fen]                 OK <game id>     new game (start position, or FEN)
+#                MOVE <id> <from> <to>     OK <game state>  make_move, e.g. MOVE 1 c1 e3
+#                STATE <id>                OK <game state> <player to move>
+#                CHECK <id> <red|black>    OK true|false    is_in_check
+#                FEN <id>                  OK <fen>
+#                CLOSE <id>                OK               end the game session
+#                QUIT                                       close the connection
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from XiangqiGame import XiangqiGame, DEMO_GAME
+
+DEFAULT_PORT = 7878
+# Pending connections the listening socket queues, enough for a load test's burst of
+# connections
+BACKLOG = 4096
+
+# Moves each load test game plays
+LOAD_MOVES = DEMO_GAME
+
+
+class GameSession:
+    """ A hosted game and the lock that serializes the requests made on it. """
+    def __init__(self, game):
+        """ Initializes data members. """
+        self._game = game
+        self._lock = asyncio.Lock()
+
+    def get_game(self):
+        """ Returns the session's XiangqiGame. """
+        return self._game
+
+    def get_lock(self):
+        """ Returns the asyncio lock to hold while using the game. """
+        return self._lock
+
+
+class GameServer:
+    """ Hosts game sessions by id and answers protocol requests on them. """
+    def __init__(self):
+        """ Initializes data members. """
+        self._sessions = {}
+        self._next_id = 1
+        # request handlers by command, each taking the request's arguments
+        self._commands = {
+            'NEW': self.command_new,
+            'MOVE': self.command_move,
+            'STATE': self.command_state,
+            'CHECK': self.command_check,
+            'FEN': self.command_fen,
+            'CLOSE': self.command_close,
+        }
+
+    def get_session_count(self):
+        """ Returns the number of open game sessions. """
+        return len(self._sessions)
+
+    async def serve(self, host='127.0.0.1', port=DEFAULT_PORT, path=None):
+        """ Serves connections on a Unix socket at path, or on host and port, until cancelled. """
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, path=path, backlog=BACKLOG)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port, backlog=BACKLOG)
+        async with server:
+            await server.serve_forever()
+
+    async def handle_client(self, reader, writer):
+        """ Answers the requests of one connection until it sends QUIT or closes. """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                fields = line.decode('ascii', 'replace').split()
+                if not fields:
+                    continue
+                if fields[0].upper() == 'QUIT':
+                    break
+                writer.write((await self.handle_request(fields) + '\n').encode('ascii'))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, fields):
+        """ Returns the response line (without newline) to a request split into fields. """
+        command = self._commands.get(fields[0].upper())
+        if command is None:
+            return "ERR unknown command " + fields[0]
+        return await command(fields[1:])
+
+    def find_session(self, args, count, usage):
+        """
+        Returns (session, None) for the game id of a request's arguments, or (None, error
+        response) if the arguments are not count in number or the game does not exist.
+        """
+        if len(args) != count:
+            return None, "ERR usage: " + usage
+        session = self._sessions.get(args[0])
+        if session is None:
+            return None, "ERR unknown game " + args[0]
+        return session, None
+
+    async def command_new(self, args):
+        """ NEW [fen]: starts a game and answers its id. """
+        if args:
+            try:
+                game = XiangqiGame.from_fen(' '.join(args))
+            except ValueError as error:
+                return "ERR " + str(error)
+        else:
+            game = XiangqiGame()
+        game_id = str(self._next_id)
+        self._next_id += 1
+        self._sessions[game_id] = GameSession(game)
+        return "OK " + game_id
+
+    async def command_move(self, args):
+        """
+        MOVE <id> <from> <to>: makes a move and answers the game state. The move and the
+        scan for the opponent's replies run on the event loop.
+        """
+        session, error = self.find_session(args, 3, "MOVE <id> <from> <to>")
+        if error:
+            return error
+        async with session.get_lock():
+            game = session.get_game()
+            try:
+                moved = game.make_move(args[1], args[2])
+            except (ValueError, IndexError):
+                moved = False
+            if moved is False:
+                return "ERR illegal move"
+            return "OK " + game.get_game_state()
+
+    async def command_state(self, args):
+        """ STATE <id>: answers the game state and the player to move. """
+        session, error = self.find_session(args, 1, "STATE <id>")
+        if error:
+            return error
+        async with session.get_lock():
+            game = session.get_game()
+            return "OK " + game.get_game_state() + " " + game.get_player_turn()
+
+    async def command_check(self, args):
+        """ CHECK <id> <red|black>: answers whether the player is in check. """
+        session, error = self.find_session(args, 2, "CHECK <id> <red|black>")
+        if error:
+            return error
+        if args[1] not in ('red', 'black'):
+            return "ERR player must be red or black"
+        async with session.get_lock():
+            return "OK " + ("true" if session.get_game().is_in_check(args[1]) else "false")
+
+    async def command_fen(self, args):
+        """ FEN <id>: answers the game's position in Xiangqi FEN. """
+        session, error = self.find_session(args, 1, "FEN <id>")
+        if error:
+            return error
+        async with session.get_lock():
+            return "OK " + session.get_game().to_fen()
+
+    async def command_close(self, args):
+        """ CLOSE <id>: ends a game session. """
+        session, error = self.find_session(args, 1, "CLOSE <id>")
+        if error:
+            return error
+        async with session.get_lock():
+            del self._sessions[args[0]]
+        return "OK"
+
+
+async def play_games(connect, game_count, moves, latencies):
+    """
+    Opens a connection with connect(), starts game_count games on it, makes the moves on
+    each game in turn (one request in flight), appending each MOVE request's latency in
+    seconds to latencies, then closes the games. Raises RuntimeError on an error response.
+    """
+    reader, writer = await connect()
+
+    async def request(line):
+        writer.write(line.encode('ascii') + b'\n')
+        await writer.drain()
+        response = (await reader.readline()).decode('ascii').strip()
+        if not response.startswith('OK'):
+            raise RuntimeError(line + ": " + response)
+        return response
+
+    try:
+        game_ids = [(await request("NEW")).split()[1] for index in range(game_count)]
+        for from_str, to_str in moves:
+            for game_id in game_ids:
+                start = time.perf_counter()
+                await request("MOVE %s %s %s" % (game_id, from_str, to_str))
+                latencies.append(time.perf_counter() - start)
+        for game_id in game_ids:
+            await request("CLOSE " + game_id)
+        writer.write(b'QUIT\n')
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+def percentile(values, fraction):
+    """ Returns the value at fraction (0 to 1) of a sorted list (nearest rank). """
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def run_load(connect, games, connections=None, moves=LOAD_MOVES):
+    """
+    Plays games concurrent games of moves against a server, spread over connections
+    connections (one per game if None), and returns a dict of the move count, the wall
+    time in seconds, moves per second and the p50, p99 and maximum move latencies.
+    """
+    connections = min(connections or games, games)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(play_games(connect, games // connections + (1 if index < games % connections else 0),
+                                      moves, latencies)
+                           for index in range(connections)))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    return {'moves': len(latencies), 'seconds': seconds, 'moves_per_second': len(latencies) / seconds,
+            'p50': percentile(latencies, 0.50), 'p99': percentile(latencies, 0.99), 'max': latencies[-1]}
+
+
+def wait_for_server(connect, seconds=10.0):
+    """ Waits until a connection with connect() succeeds. Raises ConnectionError after seconds. """
+    async def attempt():
+        reader, writer = await connect()
+        writer.close()
+
+    deadline = time.perf_counter() + seconds
+    while True:
+        try:
+            asyncio.run(attempt())
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise ConnectionError("server did not start")
+            time.sleep(0.05)
+
+
+def main(argv=None):
+    """ Command line entry point. Returns the process exit status. """
+    parser = argparse.ArgumentParser(description="Xiangqi game session server and load generator.")
+    parser.add_argument("--host", default="127.0.0.1", help="TCP host (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port (default %d)" % DEFAULT_PORT)
+    parser.add_argument("--unix", help="Unix socket path, instead of TCP")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("serve", help="run the server")
+    load = commands.add_parser("load", help="play concurrent games against a server and report move latency")
+    load.add_argument("-g", "--games", type=int, nargs="+", default=[100],
+                      help="concurrent games, several for a series of runs (default 100)")
+    load.add_argument("-c", "--connections", type=int, help="connections to spread the games over (default: one each)")
+    load.add_argument("--spawn", action="store_true", help="start a server process for the run")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            asyncio.run(GameServer().serve(args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.unix:
+        def connect():
+            return asyncio.open_unix_connection(args.unix)
+    else:
+        def connect():
+            return asyncio.open_connection(args.host, args.port)
+    server = None
+    if args.spawn:
+        address = ["--unix", args.unix] if args.unix else ["--host", args.host, "--port", str(args.port)]
+        server = subprocess.Popen([sys.executable, os.path.abspath(__file__)] + address + ["serve"])
+    try:
+        wait_for_server(connect)
+        for games in args.games:
+            result = asyncio.run(run_load(connect, games, args.connections))
+            print("games %6d  moves %8d  %8.0f moves/sec  p50 %7.2f ms  p99 %7.2f ms  max %7.2f ms" % (
+                games, result['moves'], result['moves_per_second'], 1000 * result['p50'], 1000 * result['p99'],
+                1000 * result['max']))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
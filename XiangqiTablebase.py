@@ -0,0 +1,728 @@
+# Description: Endgame tablebases for XiangqiGame. A table holds the exact result and distance
+#              to mate, with best play, of every position of one material set (such as red
+#              Chariot against black General and two Advisors, 'KRvKAA'), worked out by
+#              retrograde analysis on the game's own rules. Positions reached by a capture are
+#              looked up in the smaller tables, which are generated first. Tables are files of
+#              one uint16 per position, read through mmap, so probing a position is an index
+#              computation and one read.
+#
+#              File layout (all integers little-endian):
+#                header      magic 'XQTB', version, piece count, the mailbox codes of the
+#                            pieces (red first, in index order, zero padded) and the number
+#                            of entries
+#                entries     one uint16 per position index (see Table.encode): DRAW, INVALID
+#                            (pieces overlapping, or the player not to move in check), or
+#                            plies to mate + 2; an even number of plies is a loss for the
+#                            player to move, an odd number a win
+#
+#              Perpetual check and chasing are not ruled on: positions that neither side can
+#              force to mate are draws.
+#
+#              A table can be checked with verify, which plays one ply from every position
+#              (or a sample) and compares the entry with the one implied by the entries of the
+#              positions reached.
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from XiangqiGame import XiangqiGame, loc_to_square, square_to_loc, BOARD_SQUARES, PALACE, ADVISOR_SQUARES, \
+    ELEPHANT_SQUARES, SOLDIER_MOVES, BOARD_SIZE, FEN_LETTERS, FEN_CODES, TYPE_MASK, GENERAL, ADVISOR, ELEPHANT, SOLDIER, \
+    RED, BLACK
+from XiangqiDatabase import write_array
+
+MAGIC = b'XQTB'
+VERSION = 1
+HEADER = struct.Struct('<4sHH16sQ')
+MAX_PIECES = 16
+
+# Table entries
+DRAW = 0
+INVALID = 1
+DISTANCE_OFFSET = 2
+
+# Flags of a position found by the forward pass
+FLAG_INVALID = 1
+# the position has a capture that does not lose, so it can never be lost
+FLAG_SAFE = 2
+
+# Positions per forward pass task
+CHUNK_SIZE = 4096
+
+
+def soldier_squares(side):
+    """ Returns the sorted mailbox squares a soldier of side can ever stand on. """
+    start_row = 3 if side == RED else 6
+    reached = {loc_to_square((start_row, col)) for col in range(0, 9, 2)}
+    frontier = list(reached)
+    while frontier:
+        square = frontier.pop()
+        for move in SOLDIER_MOVES[side][square]:
+            if move not in reached:
+                reached.add(move)
+                frontier.append(move)
+    return sorted(reached)
+
+
+def piece_squares(code):
+    """ Returns the sorted mailbox squares a piece with mailbox code can stand on. """
+    kind = code & TYPE_MASK
+    side = code & ~TYPE_MASK
+    if kind == GENERAL:
+        return sorted(PALACE[side])
+    if kind == ADVISOR:
+        return sorted(ADVISOR_SQUARES[side])
+    if kind == ELEPHANT:
+        return sorted(ELEPHANT_SQUARES[side])
+    if kind == SOLDIER:
+        return soldier_squares(side)
+    return sorted(BOARD_SQUARES)
+
+
+def parse_material(name):
+    """
+    Returns the tuple of mailbox codes of a material set named like 'KRvKAA' (red pieces,
+    'v', black pieces, in FEN letters), red first and sorted by type within each side.
+    Raises ValueError if the name is malformed or a side does not have exactly one General.
+    """
+    sides = name.upper().split('V')
+    if len(sides) != 2:
+        raise ValueError("material " + name + " is not of the form KRvKAA")
+    codes = []
+    for side, letters in zip((RED, BLACK), sides):
+        try:
+            kinds = sorted(FEN_CODES[letter] & TYPE_MASK for letter in letters)
+        except KeyError:
+            raise ValueError("unknown piece letter in material " + name)
+        if kinds.count(GENERAL) != 1:
+            raise ValueError("each side of material " + name + " must have exactly one General")
+        codes.extend(side | kind for kind in kinds)
+    if len(codes) > MAX_PIECES:
+        raise ValueError("material " + name + " has too many pieces")
+    return tuple(codes)
+
+
+def material_name(codes):
+    """ Returns the name (such as 'KRvKAA') of a material set given as mailbox codes. """
+    return 'v'.join(''.join(FEN_LETTERS[code & TYPE_MASK].upper() for code in sorted(codes) if code & side)
+                    for side in (RED, BLACK))
+
+
+def sort_material(codes):
+    """
+    Returns mailbox codes in table order: red first, sorted by type within each side
+    (which is increasing code order, as RED is less than BLACK).
+    """
+    return tuple(sorted(codes))
+
+
+# Mailbox square reflected across the river (row r to row 9 - r), by mailbox square
+MIRROR_SQUARES = [0] * BOARD_SIZE
+for mirror_from in BOARD_SQUARES:
+    MIRROR_SQUARES[mirror_from] = loc_to_square((9 - square_to_loc(mirror_from)[0], square_to_loc(mirror_from)[1]))
+del mirror_from
+
+
+def swap_side(code):
+    """ Returns a mailbox code with its player changed. """
+    return code ^ (RED | BLACK)
+
+
+class Table:
+    """
+    Position indexing of one material set, and, once opened with open(), read access to
+    its table file. A position is the square of each piece (in the order of the material
+    codes) and the player to move; each piece only takes the squares it can reach (the
+    palace for Generals and so on). Identical pieces are ordered by square, so each
+    position has exactly one index; indexes of other orders are INVALID entries.
+    """
+    def __init__(self, codes):
+        """ Initializes data members from the material codes, in table order. """
+        self._codes = sort_material(codes)
+        self._squares = [piece_squares(code) for code in self._codes]
+        self._digits = [{square: digit for digit, square in enumerate(squares)} for squares in self._squares]
+        # runs (start, end) of identical pieces, whose squares are kept in increasing order
+        self._groups = []
+        start = 0
+        for index in range(1, len(self._codes) + 1):
+            if index == len(self._codes) or self._codes[index] != self._codes[start]:
+                if index - start > 1:
+                    self._groups.append((start, index))
+                start = index
+        self._size = 2
+        for squares in self._squares:
+            self._size *= len(squares)
+        self._map = None
+
+    def get_codes(self):
+        """ Returns the mailbox codes of the pieces, in table order. """
+        return self._codes
+
+    def get_name(self):
+        """ Returns the material name, such as 'KRvKAA'. """
+        return material_name(self._codes)
+
+    def __len__(self):
+        """ Returns the number of position indexes. """
+        return self._size
+
+    def encode(self, squares, black_to_move):
+        """
+        Returns the index of the position with the pieces on the mailbox squares (in the
+        order of the material codes; identical pieces in any order) and black to move if
+        black_to_move is 1 (red if 0). Raises KeyError if a piece is on a square the table
+        does not index.
+        """
+        if self._groups:
+            squares = list(squares)
+            for start, end in self._groups:
+                squares[start:end] = sorted(squares[start:end])
+        index = 0
+        for digits, square in zip(self._digits, squares):
+            index = index * len(digits) + digits[square]
+        return index * 2 + black_to_move
+
+    def decode(self, index):
+        """
+        Returns (squares, black_to_move) of a position index, or None if the index is not
+        the canonical index of a position (identical pieces out of order or overlapping).
+        """
+        black_to_move = index & 1
+        index >>= 1
+        squares = [0] * len(self._codes)
+        for slot in range(len(self._codes) - 1, -1, -1):
+            index, digit = divmod(index, len(self._squares[slot]))
+            squares[slot] = self._squares[slot][digit]
+        for start, end in self._groups:
+            for slot in range(start + 1, end):
+                if squares[slot - 1] >= squares[slot]:
+                    return None
+        if len(set(squares)) != len(squares):
+            return None
+        return squares, black_to_move
+
+    def open(self, path):
+        """ Maps the table file at path for reading. Raises ValueError if it is not this table's file. """
+        with open(path, 'rb') as file:
+            table_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, codes, size = HEADER.unpack_from(table_map, 0)
+        if magic != MAGIC or version != VERSION or tuple(codes[:count]) != self._codes or size != self._size:
+            table_map.close()
+            raise ValueError(path + " is not a version " + str(VERSION) + " " + self.get_name() + " table")
+        self._map = table_map
+
+    def close(self):
+        """ Unmaps the table file. """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def get(self, index):
+        """ Returns the table entry of a position index. """
+        return struct.unpack_from('<H', self._map, HEADER.size + 2 * index)[0]
+
+
+def entry_result(entry):
+    """
+    Returns the (result, plies) pair of a table entry for the player to move: ('WIN', n)
+    or ('LOSS', n) for a mate in n plies with best play, ('DRAW', None), or None for an
+    INVALID entry.
+    """
+    if entry == DRAW:
+        return 'DRAW', None
+    if entry == INVALID:
+        return None
+    plies = entry - DISTANCE_OFFSET
+    return ('WIN' if plies % 2 else 'LOSS'), plies
+
+
+class Tablebase:
+    """
+    The tables found in a directory, opened when first needed. Positions are looked up
+    with their pieces as placed, or reflected across the river with the players swapped,
+    so one table serves both players. Call close() (or use as a context manager) when done.
+    """
+    def __init__(self, directory):
+        """ Initializes data members. """
+        self._directory = directory
+        # open tables (or None if there is no file) by sorted material codes, with a flag
+        # telling whether positions must be mirrored to look them up
+        self._tables = {}
+        # pieces of the largest table, positions with more pieces are not looked up
+        self._max_pieces = 0
+        if os.path.isdir(directory):
+            for file_name in os.listdir(directory):
+                if file_name.endswith('.xqtb'):
+                    try:
+                        self._max_pieces = max(self._max_pieces, len(parse_material(file_name[:-5])))
+                    except ValueError:
+                        continue
+
+    def __enter__(self):
+        """ Returns the tablebase for use in a with statement. """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """ Closes the tablebase at the end of a with statement. """
+        self.close()
+
+    def close(self):
+        """ Unmaps all open tables. """
+        for found in self._tables.values():
+            if found is not None:
+                found[0].close()
+        self._tables = {}
+
+    def get_max_pieces(self):
+        """ Returns the number of pieces (Generals included) of the largest table found. """
+        return self._max_pieces
+
+    def table_path(self, codes):
+        """ Returns the path of the file of a material set's table. """
+        return os.path.join(self._directory, material_name(codes) + '.xqtb')
+
+    def find_table(self, codes):
+        """
+        Returns (table, mirrored) for material codes in table order, where mirrored tells
+        whether the table is that of the material with the players swapped, or None if
+        neither file exists.
+        """
+        if codes in self._tables:
+            return self._tables[codes]
+        found = None
+        for mirrored, table_codes in ((False, codes), (True, sort_material(swap_side(code) for code in codes))):
+            path = self.table_path(table_codes)
+            if os.path.exists(path):
+                table = Table(table_codes)
+                table.open(path)
+                found = (table, mirrored)
+                break
+        self._tables[codes] = found
+        return found
+
+    def probe_entry(self, pieces, black_to_move):
+        """
+        Returns the table entry of a position given as a sorted list of (mailbox code,
+        mailbox square) pairs of its pieces and the player to move (1 if black), or None
+        if there is no table for it or a piece stands on a square its table does not index
+        (a soldier behind its starting rank, for instance, which FEN input allows).
+        """
+        found = self.find_table(tuple(code for code, square in pieces))
+        if found is None:
+            return None
+        table, mirrored = found
+        if mirrored:
+            pieces = sorted((swap_side(code), MIRROR_SQUARES[square]) for code, square in pieces)
+            black_to_move ^= 1
+        try:
+            index = table.encode([square for code, square in pieces], black_to_move)
+        except KeyError:
+            return None
+        return table.get(index)
+
+    def probe(self, game):
+        """
+        Returns the result of the game's position for the player to move as ('WIN', n),
+        ('LOSS', n) (mate in n plies with best play) or ('DRAW', None), or None if there is
+        no table for its material.
+        """
+        if len(game.get_pieces('red')) + len(game.get_pieces('black')) > self._max_pieces:
+            return None
+        pieces = sorted([(piece.get_code(), piece.get_square()) for piece in game.get_pieces('red')]
+                        + [(piece.get_code(), piece.get_square()) for piece in game.get_pieces('black')])
+        entry = self.probe_entry(pieces, 0 if game.get_player_turn() == 'red' else 1)
+        if entry is None:
+            return None
+        return entry_result(entry)
+
+    def best_move(self, game):
+        """
+        Returns the best legal move of the game's position as an algebraic (from, to) pair,
+        with its result for the player to move: the shortest win, else a draw, else the
+        longest loss. Returns None if the position has no legal move or a move leads to a
+        position without a table.
+        """
+        best = None
+        best_rank = None
+        for from_loc, to_loc in list(game.iter_legal_moves(algebraic=False)):
+            game.push_move(from_loc, to_loc)
+            try:
+                result = self.probe(game)
+            finally:
+                game.pop_move()
+            if result is None:
+                return None
+            # rank the opponent's result from the mover's point of view, lower is better
+            outcome, plies = result
+            if outcome == 'LOSS':
+                rank, result = (0, plies), ('WIN', plies + 1)
+            elif outcome == 'DRAW':
+                rank, result = (1, 0), result
+            else:
+                rank, result = (2, -plies), ('LOSS', plies + 1)
+            if best_rank is None or rank < best_rank:
+                best_rank = rank
+                best = ((game.tuple_to_str(from_loc), game.tuple_to_str(to_loc)), result)
+        return best
+
+
+# Per-process state of a forward pass worker, set up by init_worker
+worker_table = None
+worker_tablebase = None
+
+
+def init_worker(codes, directory):
+    """ Process pool initializer: sets up the table being generated and opens the smaller tables. """
+    global worker_table, worker_tablebase
+    worker_table = Table(codes)
+    worker_tablebase = Tablebase(directory)
+
+
+def board_codes(codes, squares):
+    """ Returns the 90 square codes, as load_position takes them, of pieces on mailbox squares. """
+    board = bytearray(90)
+    for code, square in zip(codes, squares):
+        row, col = square_to_loc(square)
+        board[row * 9 + col] = code
+    return board
+
+
+def analyse_chunk(start, stop):
+    """
+    Forward pass over position indexes start to stop of the worker's table. Plays every
+    legal move of every valid position and returns arrays over the chunk: the flags (see
+    FLAG_INVALID and FLAG_SAFE), the end offsets of each position's successors within
+    the flattened successor indexes (moves within the table), the successor indexes, the
+    shortest win by a capture (plies + 1, 0 if none) and the longest loss by a capture
+    (plies, 0 if none).
+    """
+    table = worker_table
+    codes = table.get_codes()
+    game = XiangqiGame()
+    flags = bytearray(stop - start)
+    ends = array('I')
+    successors = array('I')
+    capture_wins = array('H', bytes(2 * (stop - start)))
+    capture_losses = array('H', bytes(2 * (stop - start)))
+    for offset, index in enumerate(range(start, stop)):
+        ends.append(len(successors))
+        position = table.decode(index)
+        if position is None:
+            flags[offset] = FLAG_INVALID
+            continue
+        squares, black_to_move = position
+        game.load_position(board_codes(codes, squares), 'black' if black_to_move else 'red')
+        # the player not to move must not be in check (nor the Generals facing each other)
+        if game.is_general_attacked('red' if black_to_move else 'black'):
+            flags[offset] = FLAG_INVALID
+            continue
+
+        slots = {square: slot for slot, square in enumerate(squares)}
+        for from_loc, to_loc in game.iter_legal_moves(algebraic=False):
+            to_square = loc_to_square(to_loc)
+            moved = list(squares)
+            moved[slots[loc_to_square(from_loc)]] = to_square
+            if to_square not in slots:
+                successors.append(table.encode(moved, black_to_move ^ 1))
+                continue
+            # a capture leads into the table of the material left
+            captured = slots[to_square]
+            left = sorted(zip(codes[:captured] + codes[captured + 1:], moved[:captured] + moved[captured + 1:]))
+            entry = worker_tablebase.probe_entry(left, black_to_move ^ 1)
+            if entry is None or entry == INVALID:
+                raise RuntimeError("no table entry after a capture in " + table.get_name())
+            if entry == DRAW:
+                flags[offset] |= FLAG_SAFE
+                continue
+            plies = entry - DISTANCE_OFFSET
+            if plies % 2 == 0:
+                # the opponent is mated in plies, so this position is won in plies + 1
+                flags[offset] |= FLAG_SAFE
+                if capture_wins[offset] == 0 or plies + 2 < capture_wins[offset]:
+                    capture_wins[offset] = plies + 2
+            else:
+                capture_losses[offset] = max(capture_losses[offset], plies + 1)
+    ends.append(len(successors))
+    return flags, ends, successors, capture_wins, capture_losses
+
+
+def run_forward_pass(table, directory, workers, chunk_size=CHUNK_SIZE):
+    """
+    Runs analyse_chunk over the whole table, on a pool of workers processes (in this
+    process if workers is 0), and returns the chunk results joined: flags, successor
+    offsets (one more than the number of positions), successor indexes, capture wins and
+    capture losses.
+    """
+    flags = bytearray()
+    offsets = array('I', [0])
+    successors = array('I')
+    capture_wins = array('H')
+    capture_losses = array('H')
+    bounds = [(start, min(start + chunk_size, len(table))) for start in range(0, len(table), chunk_size)]
+
+    def join(result):
+        chunk_flags, ends, chunk_successors, chunk_wins, chunk_losses = result
+        base = len(successors)
+        flags.extend(chunk_flags)
+        offsets.extend(base + end for end in ends[1:])
+        successors.extend(chunk_successors)
+        capture_wins.extend(chunk_wins)
+        capture_losses.extend(chunk_losses)
+
+    if workers == 0:
+        init_worker(table.get_codes(), directory)
+        for start, stop in bounds:
+            join(analyse_chunk(start, stop))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(table.get_codes(), directory)) as pool:
+            for result in pool.map(analyse_chunk, *zip(*bounds)):
+                join(result)
+    return flags, offsets, successors, capture_wins, capture_losses
+
+
+def invert_moves(size, offsets, successors):
+    """
+    Returns (offsets, predecessors): for each position index, the range of the
+    predecessor array holding the positions with a move (within the table) to it.
+    """
+    counts = array('I', bytes(4 * (size + 1)))
+    for successor in successors:
+        counts[successor + 1] += 1
+    for index in range(size):
+        counts[index + 1] += counts[index]
+    starts = array('I', counts)
+    predecessors = array('I', bytes(4 * len(successors)))
+    for index in range(size):
+        for successor in successors[offsets[index]:offsets[index + 1]]:
+            predecessors[starts[successor]] = index
+            starts[successor] += 1
+    return counts, predecessors
+
+
+def retrograde(size, flags, offsets, successors, capture_wins, capture_losses):
+    """
+    Returns the array of table entries from the forward pass results. Positions are
+    resolved in order of distance to mate with a bucket queue: a lost position makes each
+    of its predecessors a win one ply longer, and a won position uses up one move of each
+    predecessor, which is lost once all its moves are used up (at the distance of its
+    longest loss). Moves into smaller tables are resolved up front. Positions never
+    resolved are draws.
+    """
+    entries = array('H', bytes(2 * size))
+    # moves within the table not yet known to lose, plus one for a capture that does not
+    remaining = array('H', bytes(2 * size))
+    buckets = []
+
+    def push(plies, index):
+        while len(buckets) <= plies:
+            buckets.append([])
+        buckets[plies].append(index)
+
+    for index in range(size):
+        if flags[index] & FLAG_INVALID:
+            entries[index] = INVALID
+            continue
+        remaining[index] = offsets[index + 1] - offsets[index] + (1 if flags[index] & FLAG_SAFE else 0)
+        if remaining[index] == 0:
+            # no legal move, or only captures that lose
+            push(capture_losses[index], index)
+        if capture_wins[index]:
+            push(capture_wins[index] - 1, index)
+
+    predecessor_offsets, predecessors = invert_moves(size, offsets, successors)
+    plies = 0
+    while plies < len(buckets):
+        for index in buckets[plies]:
+            if entries[index] != DRAW:
+                continue
+            entries[index] = plies + DISTANCE_OFFSET
+            start, end = predecessor_offsets[index], predecessor_offsets[index + 1]
+            if plies % 2 == 0:
+                # lost here, so moving here wins
+                for predecessor in predecessors[start:end]:
+                    if entries[predecessor] == DRAW:
+                        push(plies + 1, predecessor)
+            else:
+                # won here, so moving here loses
+                for predecessor in predecessors[start:end]:
+                    remaining[predecessor] -= 1
+                    if remaining[predecessor] == 0:
+                        push(max(plies + 1, capture_losses[predecessor]), predecessor)
+        buckets[plies] = None
+        plies += 1
+    return entries
+
+
+def generate(name, directory, workers=None, log=None):
+    """
+    Generates the table of a material set (such as 'KRvKAA') in directory, after the
+    tables of every smaller material set reachable by captures, skipping tables whose
+    file (or that of the material with the players swapped) already exists. Forward
+    passes run on workers processes (the CPU count if None, in this process if 0). If
+    log is given, it is called with a line of text per table generated. Returns the path
+    of the table file.
+    """
+    codes = parse_material(name)
+    tablebase = Tablebase(directory)
+    try:
+        found = tablebase.find_table(codes)
+        if found is not None:
+            return tablebase.table_path(found[0].get_codes())
+    finally:
+        tablebase.close()
+    for captured in range(len(codes)):
+        if codes[captured] & TYPE_MASK != GENERAL:
+            generate(material_name(codes[:captured] + codes[captured + 1:]), directory, workers, log)
+
+    start = time.perf_counter()
+    table = Table(codes)
+    flags, offsets, successors, capture_wins, capture_losses = run_forward_pass(
+        table, directory, workers if workers is not None else os.cpu_count())
+    entries = retrograde(len(table), flags, offsets, successors, capture_wins, capture_losses)
+
+    path = tablebase.table_path(codes)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, VERSION, len(codes), bytes(codes), len(table)))
+        write_array(out, 'H', entries)
+    os.replace(temporary, path)
+    if log is not None:
+        counts = {'win': 0, 'loss': 0, 'draw': 0}
+        longest = 0
+        for entry in entries:
+            if entry == DRAW:
+                counts['draw'] += 1
+            elif entry != INVALID:
+                counts['win' if (entry - DISTANCE_OFFSET) % 2 else 'loss'] += 1
+                longest = max(longest, entry - DISTANCE_OFFSET)
+        log("%-10s %9d positions  %8d wins %8d losses %8d draws  longest mate %3d plies  %6.1fs" % (
+            table.get_name(), len(table), counts['win'], counts['loss'], counts['draw'], longest,
+            time.perf_counter() - start))
+    return path
+
+
+def verify(name, directory, sample=None, seed=0):
+    """
+    Checks the table of a material set in directory one ply deep: every position index
+    (or sample of them, picked with seed) must be INVALID exactly when the position is,
+    and otherwise hold the result implied by probing every position one legal move away:
+    a loss in 0 plies without a legal move, a win in n + 1 plies if a move leads to a loss
+    in n (the shortest), a loss in n + 1 if every move leads to a win (the longest n), and
+    a draw otherwise. Returns (positions checked, list of mismatch descriptions). Raises
+    ValueError if there is no table for the material.
+    """
+    codes = parse_material(name)
+    with Tablebase(directory) as tablebase:
+        found = tablebase.find_table(codes)
+        if found is None:
+            raise ValueError("no " + material_name(codes) + " table in " + directory)
+        table = found[0]
+        codes = table.get_codes()
+        indexes = range(len(table))
+        if sample is not None and sample < len(table):
+            indexes = random.Random(seed).sample(indexes, sample)
+        game = XiangqiGame()
+        checked = 0
+        mismatches = []
+        for index in indexes:
+            entry = table.get(index)
+            position = table.decode(index)
+            if position is not None:
+                squares, black_to_move = position
+                game.load_position(board_codes(codes, squares), 'black' if black_to_move else 'red')
+                if game.is_general_attacked('red' if black_to_move else 'black'):
+                    position = None
+            checked += 1
+            if position is None:
+                if entry != INVALID:
+                    mismatches.append("index %d: invalid position has entry %d" % (index, entry))
+                continue
+            results = []
+            for from_loc, to_loc in game.iter_legal_moves(algebraic=False):
+                game.push_move(from_loc, to_loc)
+                results.append(tablebase.probe(game))
+                game.pop_move()
+            if None in results:
+                expected = "a probe of a position one move away to succeed"
+            elif not results:
+                expected = ('LOSS', 0)
+            elif any(result[0] == 'LOSS' for result in results):
+                expected = ('WIN', 1 + min(result[1] for result in results if result[0] == 'LOSS'))
+            elif all(result[0] == 'WIN' for result in results):
+                expected = ('LOSS', 1 + max(result[1] for result in results))
+            else:
+                expected = ('DRAW', None)
+            if entry_result(entry) != expected:
+                mismatches.append("index %d (%s): entry %s, expected %s" % (index, game.to_fen(), entry_result(entry),
+                                                                          expected))
+    return checked, mismatches
+
+
+def main(argv=None):
+    """ Command line entry point. Returns the process exit status. """
+    parser = argparse.ArgumentParser(description="Generate and probe Xiangqi endgame tablebases.")
+    parser.add_argument("-d", "--directory", default=".", help="directory of the table files (default .)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate_parser = commands.add_parser("generate", help="generate tables, such as KRvKAA (red first)")
+    generate_parser.add_argument("material", nargs="+")
+    generate_parser.add_argument("-w", "--workers", type=int, help="worker processes (default: CPU count, 0 for none)")
+    probe_parser = commands.add_parser("probe", help="print the result and best move of a position")
+    probe_parser.add_argument("fen", help="position in Xiangqi FEN")
+    verify_parser = commands.add_parser("verify", help="check tables against one ply of play from their positions")
+    verify_parser.add_argument("material", nargs="+")
+    verify_parser.add_argument("-s", "--sample", type=int, help="positions to check per table (default: all)")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        os.makedirs(args.directory, exist_ok=True)
+        for name in args.material:
+            try:
+                generate(name, args.directory, args.workers, log=print)
+            except ValueError as error:
+                parser.error(str(error))
+        return 0
+
+    if args.command == "verify":
+        status = 0
+        for name in args.material:
+            start = time.perf_counter()
+            try:
+                checked, mismatches = verify(name, args.directory, args.sample)
+            except ValueError as error:
+                parser.error(str(error))
+            print("%-10s %9d positions checked  %d mismatches  %6.1fs" % (
+                name, checked, len(mismatches), time.perf_counter() - start))
+            for mismatch in mismatches[:10]:
+                print("  " + mismatch)
+            if mismatches:
+                status = 1
+        return status
+
+    try:
+        game = XiangqiGame.from_fen(args.fen)
+    except ValueError as error:
+        parser.error(str(error))
+    with Tablebase(args.directory) as tablebase:
+        start = time.perf_counter()
+        result = tablebase.probe(game)
+        seconds = time.perf_counter() - start
+        if result is None:
+            print("no table entry for this position")
+            return 1
+        print("%s %s (probe %.1f us)" % (result[0], "" if result[1] is None else "in %d plies" % result[1],
+                                         1e6 * seconds))
+        best = tablebase.best_move(game)
+        if best is not None:
+            print("best move %s%s" % best[0])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
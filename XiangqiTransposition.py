@@ -0,0 +1,187 @@
+# Description: Fixed-size transposition table for the XiangqiGame search, keyed by the
+#              position's Zobrist key. Entries live in one preallocated buffer of 64-bit
+#              words, two entries per bucket (depth-preferred and always-replace), so the
+#              memory used is set by a megabyte budget and never grows.
+
+# Bound types: the stored score is exact, a lower bound (the search failed high) or an
+# upper bound (the search failed low)
+EXACT = 1
+LOWER = 2
+UPPER = 3
+
+# Each entry is two 64-bit words: the position key XORed with the packed data, and the
+# packed data. Storing key ^ data lets a table shared between processes be read and
+# written without locks: an entry torn by two concurrent writers fails the key check.
+WORDS_PER_ENTRY = 2
+ENTRIES_PER_BUCKET = 2
+BYTES_PER_BUCKET = 8 * WORDS_PER_ENTRY * ENTRIES_PER_BUCKET
+
+# Layout of the data word (bit offset, width): best move from/to squares, score (offset to
+# make it non-negative), depth, bound type and the search generation that stored it
+FROM_SHIFT = 0
+TO_SHIFT = 8
+SCORE_SHIFT = 16
+SCORE_BITS = 20
+SCORE_OFFSET = 1 << (SCORE_BITS - 1)
+DEPTH_SHIFT = 36
+BOUND_SHIFT = 44
+GENERATION_SHIFT = 46
+GENERATION_MASK = 63
+
+
+def buffer_size(size_mb):
+    """
+    Returns the size in bytes of a table for a megabyte budget: the largest power of two
+    number of buckets that fits.
+    """
+    buckets = 1
+    while buckets * 2 * BYTES_PER_BUCKET <= size_mb * 1024 * 1024:
+        buckets *= 2
+    return buckets * BYTES_PER_BUCKET
+
+
+class TranspositionTable:
+    """
+    Transposition table of search results (depth, score, bound type, best move) keyed by
+    64-bit position keys. Each bucket holds a depth-preferred entry, which is only replaced
+    by a deeper search or one from a newer generation, and an always-replace entry.
+    """
+    def __init__(self, size_mb=16, buffer=None):
+        """
+        Initializes data members. The table takes size_mb megabytes (rounded down to a
+        power of two number of buckets) unless a zero-filled buffer is passed, in which
+        case it is used as the table's storage.
+        """
+        if buffer is None:
+            buffer = bytearray(buffer_size(size_mb))
+        self._bytes = memoryview(buffer).cast('B')
+        self._words = self._bytes.cast('Q')
+        self._mask = len(self._words) // (WORDS_PER_ENTRY * ENTRIES_PER_BUCKET) - 1
+        self._generation = 0
+        self._probes = 0
+        self._hits = 0
+        self._misses = 0
+        self._collisions = 0
+        self._stores = 0
+        self._overwrites = 0
+
+    def get_size_bytes(self):
+        """ Returns the size of the table's storage in bytes. """
+        return self._words.nbytes
+
+    def get_capacity(self):
+        """ Returns the number of entries the table holds. """
+        return (self._mask + 1) * ENTRIES_PER_BUCKET
+
+    def new_search(self):
+        """
+        Starts a new search generation. Depth-preferred entries from older generations can
+        be replaced by any new entry.
+        """
+        self._generation = (self._generation + 1) & GENERATION_MASK
+
+    def set_generation(self, generation):
+        """ Sets the search generation, so processes sharing the table can agree on it. """
+        self._generation = generation & GENERATION_MASK
+
+    def get_generation(self):
+        """ Returns the current search generation. """
+        return self._generation
+
+    def clear(self):
+        """ Empties the table and resets the statistics. """
+        self._bytes[:] = bytes(len(self._bytes))
+        self._generation = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        """ Resets the hit, miss and collision counters. """
+        self._probes = 0
+        self._hits = 0
+        self._misses = 0
+        self._collisions = 0
+        self._stores = 0
+        self._overwrites = 0
+
+    def probe(self, key):
+        """
+        Looks up a position key. Returns (depth, score, bound, from_square, to_square) if
+        the position is in the table, otherwise returns None. A from_square of 0 means no
+        best move was stored.
+        """
+        self._probes += 1
+        words = self._words
+        index = (key & self._mask) * WORDS_PER_ENTRY * ENTRIES_PER_BUCKET
+        occupied = False
+        for slot in (index, index + WORDS_PER_ENTRY):
+            data = words[slot + 1]
+            if data == 0:
+                continue
+            if words[slot] ^ data == key:
+                self._hits += 1
+                return ((data >> DEPTH_SHIFT) & 255,
+                        ((data >> SCORE_SHIFT) & (2 * SCORE_OFFSET - 1)) - SCORE_OFFSET,
+                        (data >> BOUND_SHIFT) & 3,
+                        data & 255,
+                        (data >> TO_SHIFT) & 255)
+            occupied = True
+        # the bucket held other positions (a collision) or nothing (a miss)
+        if occupied:
+            self._collisions += 1
+        else:
+            self._misses += 1
+        return None
+
+    def store(self, key, depth, score, bound, from_square=0, to_square=0):
+        """
+        Stores a search result for a position key. The depth-preferred entry of the
+        bucket is used if it is empty, holds the same position, was stored by an older
+        generation or by a search no deeper than this one; otherwise the always-replace
+        entry is used.
+        """
+        self._stores += 1
+        words = self._words
+        index = (key & self._mask) * WORDS_PER_ENTRY * ENTRIES_PER_BUCKET
+        old = words[index + 1]
+        if old != 0 and words[index] ^ old != key and (old >> GENERATION_SHIFT) & GENERATION_MASK == self._generation \
+                and (old >> DEPTH_SHIFT) & 255 > depth:
+            index += WORDS_PER_ENTRY
+            old = words[index + 1]
+        same_position = old != 0 and words[index] ^ old == key
+        if old != 0 and not same_position:
+            self._overwrites += 1
+        # keep the old best move if this result has none for the same position
+        if from_square == 0 and same_position:
+            from_square = old & 255
+            to_square = (old >> TO_SHIFT) & 255
+        data = (from_square
+                | to_square << TO_SHIFT
+                | (score + SCORE_OFFSET) << SCORE_SHIFT
+                | min(depth, 255) << DEPTH_SHIFT
+                | bound << BOUND_SHIFT
+                | self._generation << GENERATION_SHIFT)
+        words[index] = key ^ data
+        words[index + 1] = data
+
+    def get_stats(self):
+        """
+        Returns a dict of table statistics: probe, hit, miss, collision (bucket held other
+        positions), store and overwrite counts, the hit, miss and collision rates, and the
+        fraction of entries in use (sampled from the first 1000 entries).
+        """
+        probes = self._probes or 1
+        words = self._words
+        sample = min(1000, self.get_capacity())
+        used = sum(1 for slot in range(1, sample * WORDS_PER_ENTRY, WORDS_PER_ENTRY) if words[slot] != 0)
+        return {
+            'probes': self._probes,
+            'hits': self._hits,
+            'misses': self._misses,
+            'collisions': self._collisions,
+            'stores': self._stores,
+            'overwrites': self._overwrites,
+            'hit_rate': self._hits / probes,
+            'miss_rate': self._misses / probes,
+            'collision_rate': self._collisions / probes,
+            'fill': used / sample,
+        }